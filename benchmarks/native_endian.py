@@ -0,0 +1,68 @@
+"""Benchmarks reductions on big-endian against native-endian data.
+
+Writes a 4800x4800 int16 big-endian mosaic and times `max()` and `mean()` on the
+data returned with `backend.native_endian` enabled and disabled, as well as the
+one-off byte swap. Run with `python benchmarks/native_endian.py`.
+"""
+
+import tempfile
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+from wps_xr.config import config
+from wps_xr.mosaic import MosaicBackendArray, _tile_grid
+
+SHAPE = (4800, 4800)
+TILE_SIZE = 1200
+REPEAT = 20
+
+
+def write_tiles(dirname, arr, tile_size):
+    """Writes a (y, x) array as unpadded square tiles."""
+    for y in range(0, arr.shape[0], tile_size):
+        for x in range(0, arr.shape[1], tile_size):
+            tile = arr[y : y + tile_size, x : x + tile_size]
+            fn = (
+                f"{x + 1:05d}-{x + tile.shape[1]:05d}."
+                f"{y + 1:05d}-{y + tile.shape[0]:05d}"
+            )
+            tile.tofile(Path(dirname) / fn)
+
+
+def best_of(func):
+    """Returns the fastest of `REPEAT` runs in milliseconds."""
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) * 1e3
+
+
+def main():
+    rng = np.random.default_rng(0)
+    arr = rng.integers(-1000, 1000, size=SHAPE).astype(">i2")
+    config.set(
+        {
+            "index.tile_bdr": 0,
+            "index.row_order": "bottom_top",
+            "index.filename_digits": 5,
+            "backend.read_mode": "memmap",
+        }
+    )
+    with tempfile.TemporaryDirectory() as dirname:
+        write_tiles(dirname, arr, TILE_SIZE)
+        filenames = sorted(p.name for p in Path(dirname).iterdir())
+        print(f"{SHAPE[0]}x{SHAPE[1]} int16, best of {REPEAT} runs")
+        for native_endian in [False, True]:
+            with config.set({"backend.native_endian": native_endian}):
+                mosaic = MosaicBackendArray(
+                    *_tile_grid([Path(dirname) / fn for fn in filenames]), arr.dtype
+                )
+                data = mosaic._raw_indexing_method((slice(None), slice(None)))
+            label = f"native_endian={native_endian} ({data.dtype.str})"
+            for name in ["max", "mean"]:
+                func = getattr(data, name)
+                print(f"{label:<30} {name + '():':<8}{best_of(func):7.1f} ms")
+    print(f"{'byte swap':<39}{best_of(lambda: arr.astype('=i2')):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
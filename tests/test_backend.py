@@ -4,6 +4,8 @@ import pytest
 import xarray as xr
 
 from wps_xr.backend import BinaryBackend
+from wps_xr.backend_array import BinaryBackendArray
+from wps_xr.config import config
 from wps_xr.index import _construct_index
 
 test_files = Path(__file__).parents[0] / "test_files"
@@ -31,3 +33,31 @@ def test_open_dataset(filename, dtype, dims, dask):
     assert (ds.foo.values != 0).any()
     if dask:
         assert ds.foo.chunks
+
+
+@pytest.mark.parametrize("lock", [True, False])
+def test_open_dataset_lock(lock):
+    config.set({"backend.lock": lock})
+    _construct_index(test_files / "usgs")
+    ds = xr.open_dataset(
+        test_files / "usgs" / "00001-01200.00001-01200",
+        dtype="uint8",
+        engine=BinaryBackend,
+    )
+    backend_array = ds.foo.variable._data
+    while not isinstance(backend_array, BinaryBackendArray):
+        backend_array = backend_array.array
+    assert (backend_array.lock is not None) == lock
+
+
+@pytest.mark.parametrize("read_mode", ["memmap", "pread", "fromfile"])
+def test_open_dataset_writeable(read_mode):
+    config.set({"backend.read_mode": read_mode})
+    _construct_index(test_files / "usgs")
+    ds = xr.open_dataset(
+        test_files / "usgs" / "00001-01200.00001-01200",
+        dtype="uint8",
+        engine=BinaryBackend,
+    ).load()
+    ds.foo[0, 0] = 1
+    assert ds.foo[0, 0] == 1
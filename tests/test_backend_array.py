@@ -1,11 +1,16 @@
 import copy
 import itertools
+import os
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pytest
+import xarray as xr
 from dask.utils import SerializableLock
 
-from wps_xr.backend_array import BinaryBackendArray
+from wps_xr.backend_array import BinaryBackendArray, _open_files, _to_native
 from wps_xr.config import config
 
 np_arr1 = np.array([[1, 2, 3], [4, 5, 6]]).astype("int8").T
@@ -74,6 +79,7 @@ def binfile(request, tmp_path_factory):
 # it is supposed to support integers, slice, Ellipsis and np.newaxis objects
 # however, the xarray adapter does not support Ellipsis and newaxis objects,
 # so we don't test for them
+@pytest.mark.parametrize("read_mode", ["memmap", "pread", "fromfile"])
 @pytest.mark.parametrize(
     "binfile,arr,bdr",
     [
@@ -86,7 +92,8 @@ def binfile(request, tmp_path_factory):
     ],
     indirect=["binfile"],
 )
-def test_raw_indexing_method_integers(binfile, arr, bdr):
+def test_raw_indexing_method_integers(binfile, arr, bdr, read_mode):
+    config.set({"backend.read_mode": read_mode})
     config.set({"index.row_order": "bottom_top"})
     config.set({"index.tile_bdr": bdr})
     # in action, shape is inferred from filename (=> is true data shape, non-padded)
@@ -117,6 +124,7 @@ def test_raw_indexing_method_integers(binfile, arr, bdr):
         assert (test_arr._raw_indexing_method(tuple([idx])) == _arr[idx, :]).all()
 
 
+@pytest.mark.parametrize("read_mode", ["memmap", "pread", "fromfile"])
 @pytest.mark.parametrize(
     "binfile,arr,bdr",
     [
@@ -129,7 +137,8 @@ def test_raw_indexing_method_integers(binfile, arr, bdr):
     ],
     indirect=["binfile"],
 )
-def test_raw_indexing_method_slices(binfile, arr, bdr):
+def test_raw_indexing_method_slices(binfile, arr, bdr, read_mode):
+    config.set({"backend.read_mode": read_mode})
     config.set({"index.row_order": "bottom_top"})
     config.set({"index.tile_bdr": bdr})
     # in action, shape is inferred from filename (=> is true data shape, non-padded)
@@ -182,3 +191,193 @@ def test_raw_indexing_method_slices(binfile, arr, bdr):
             remove_bdr_from_arr(arr, bdr)[_idx],
             _idx,
         )
+
+
+@pytest.mark.parametrize(
+    "arr,bdr,row_order",
+    [
+        [arr2_pad, 1, "bottom_top"],
+        [arr2_pad, 1, "top_bottom"],
+        [arr3_pad, 1, "top_bottom"],
+        [arr1_pad.astype(">u2"), 1, "bottom_top"],
+        [arr1_pad.astype("<u2"), 1, "top_bottom"],
+    ],
+)
+@pytest.mark.parametrize("read_mode", ["memmap", "pread"])
+def test_read_outer(tmp_path, arr, bdr, row_order, read_mode):
+    config.set({"backend.read_mode": read_mode})
+    config.set({"index.row_order": row_order, "index.tile_bdr": bdr})
+    fn = tmp_path / "temp"
+    arr.tofile(fn)
+    shape = tuple(
+        [_shp - 2 * bdr if i < 2 else _shp for i, _shp in enumerate(arr.shape)]
+    )
+    test_arr = BinaryBackendArray(fn, shape, arr.dtype, SerializableLock())
+
+    truth = remove_bdr_from_arr(arr, bdr)
+    if row_order == "top_bottom":
+        truth = truth[::-1, ...]
+    for key in [
+        (slice(None),) * len(shape),
+        (slice(1, None),) + (slice(None),) * (len(shape) - 1),
+        (slice(None, -1),) + (slice(1, None, 2),) * (len(shape) - 1),
+        (1,) + (slice(None, None, 2),) * (len(shape) - 1),
+    ]:
+        raw_index_acc_test(test_arr._raw_indexing_method(key), truth[key], key)
+
+    # outer indexing: integer arrays index their axes independently
+    for key in [
+        (np.array([0, 2]), np.array([1])),
+        (np.array([1]), slice(None, None, -1)),
+        (0, np.array([0, 1])),
+    ]:
+        key = key + (np.array([0, 2]),) * (len(shape) - 2)
+        expected = truth[np.ix_(*[np.arange(n)[k].ravel() for n, k in zip(shape, key)])]
+        expected = expected.reshape(
+            [
+                np.arange(n)[k].size
+                for n, k in zip(shape, key)
+                if np.ndim(np.arange(n)[k])
+            ]
+        )
+        raw_index_acc_test(test_arr._raw_indexing_method(key), expected, key)
+
+
+def test_memmap_views_and_copies(tmp_path):
+    config.set({"backend.read_mode": "memmap", "index.tile_bdr": 0})
+    config.set({"index.row_order": "bottom_top"})
+    fn = tmp_path / "temp"
+    np_arr2.tofile(fn)
+    test_arr = BinaryBackendArray(fn, np_arr2.shape, np_arr2.dtype, None)
+
+    config.set({"backend.copy": False})
+    view = test_arr._raw_indexing_method((slice(None),) * 3)
+    assert not view.flags.writeable
+    assert np.shares_memory(view, test_arr._raw_indexing_method((0, 0, slice(None))))
+
+    config.set({"backend.copy": True})
+    copied = test_arr._raw_indexing_method((slice(None),) * 3)
+    assert copied.flags.writeable and copied.flags.owndata
+
+    # the mapping is never pickled, e.g. when shipping tasks to workers
+    restored = pickle.loads(pickle.dumps(test_arr))
+    assert not any(isinstance(value, np.memmap) for value in vars(restored).values())
+    assert (restored._raw_indexing_method((slice(None),) * 3) == np_arr2).all()
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+@pytest.mark.parametrize("read_mode", ["memmap", "pread"])
+def test_open_files_bounded(tmp_path, read_mode):
+    config.set({"backend.read_mode": read_mode, "index.tile_bdr": 0})
+    config.set({"index.row_order": "bottom_top"})
+    _open_files.clear()
+    num_fds = len(os.listdir("/proc/self/fd"))
+    with config.set({"backend.max_open_files": 4}):
+        for i in range(10):
+            fn = tmp_path / f"tile{i}"
+            np_arr2.tofile(fn)
+            test_arr = BinaryBackendArray(fn, np_arr2.shape, np_arr2.dtype, None)
+            res = test_arr._raw_indexing_method((slice(None),) * 3)
+            assert (res == np_arr2).all()
+            del res
+        assert len(_open_files) == 4
+        assert len(os.listdir("/proc/self/fd")) <= num_fds + 4
+    _open_files.clear()
+
+
+def test_open_files_in_use():
+    closed = []
+    with config.set({"backend.max_open_files": 0}):
+        with _open_files.acquire("tile", lambda: 3, closed.append) as handle:
+            # evicted right away, but only closed once released
+            assert handle == 3 and len(_open_files) == 0 and not closed
+        assert closed == [3]
+
+
+def test_read_pread_window(tmp_path, monkeypatch):
+    config.set({"backend.read_mode": "pread"})
+    config.set({"index.row_order": "bottom_top", "index.tile_bdr": 2})
+    arr = np.arange(104 * 104).reshape(104, 104).astype(">u2")
+    fn = tmp_path / "temp"
+    arr.tofile(fn)
+    test_arr = BinaryBackendArray(fn, (100, 100), arr.dtype, SerializableLock())
+
+    reads = []
+    _pread = os.pread
+
+    def _recording_pread(fd, n, offset):
+        reads.append(n)
+        return _pread(fd, n, offset)
+
+    monkeypatch.setattr(os, "pread", _recording_pread)
+    key = (slice(40, 50), slice(10, 20))
+    raw_index_acc_test(test_arr._raw_indexing_method(key), arr[2:-2, 2:-2][key], key)
+    # one read of 10 columns per requested row
+    assert reads == [10 * arr.dtype.itemsize] * 10
+
+
+def test_outer_indexing_through_xarray(tmp_path):
+    config.set({"backend.read_mode": "pread"})
+    config.set({"index.row_order": "bottom_top", "index.tile_bdr": 1})
+    fn = tmp_path / "temp"
+    arr2_pad.tofile(fn)
+    test_arr = BinaryBackendArray(fn, np_arr2.shape, np_arr2.dtype, SerializableLock())
+    var = xr.Variable(["y", "x", "z"], xr.core.indexing.LazilyIndexedArray(test_arr))
+
+    sel = var.isel(y=[0, 1], x=1, z=[2, 0])
+    assert (sel.values == np_arr2[[0, 1], 1][:, [2, 0]]).all()
+
+
+@pytest.mark.parametrize("lock", [None, SerializableLock()])
+def test_concurrent_reads(tmp_path, monkeypatch, lock):
+    config.set({"backend.read_mode": "pread"})
+    config.set({"index.row_order": "bottom_top", "index.tile_bdr": 0})
+    arr = np.arange(64 * 8).reshape(64, 8).astype("int16")
+    fn = tmp_path / "temp"
+    arr.tofile(fn)
+    test_arr = BinaryBackendArray(fn, arr.shape, arr.dtype, lock)
+
+    # count the reads in flight: each read waits for a second one to overlap it,
+    # which can only happen if the reads aren't serialized by the lock
+    counter = threading.Lock()
+    overlap = threading.Event()
+    active, max_active = 0, 0
+    _pread = os.pread
+
+    def _counting_pread(fd, n, offset):
+        nonlocal active, max_active
+        with counter:
+            active += 1
+            max_active = max(max_active, active)
+            if active > 1:
+                overlap.set()
+        overlap.wait(timeout=5 if lock is None else 0.01)
+        with counter:
+            active -= 1
+        return _pread(fd, n, offset)
+
+    monkeypatch.setattr(os, "pread", _counting_pread)
+    keys = [(slice(i, i + 4), slice(0, 8)) for i in range(0, 64, 4)]
+    with ThreadPoolExecutor(max_workers=len(keys)) as pool:
+        results = list(pool.map(test_arr._raw_indexing_method, keys))
+
+    for key, res in zip(keys, results):
+        raw_index_acc_test(res, arr[key], key)
+    # lock-free reads overlap, locked reads are serialized
+    if lock is None:
+        assert max_active > 1
+    else:
+        assert max_active == 1
+
+
+def test_to_native():
+    arr = np.arange(6, dtype=">i2")
+    res = _to_native(arr)
+    assert res.dtype.isnative and (res == np.arange(6)).all()
+    # writeable arrays are swapped in place
+    assert np.shares_memory(res, arr)
+
+    arr = np.frombuffer(np.arange(6, dtype=">i2").tobytes(), ">i2")
+    res = _to_native(arr)
+    assert res.dtype.isnative and (res == np.arange(6)).all()
+    assert not np.shares_memory(res, arr)
@@ -0,0 +1,169 @@
+import importlib.util
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from wps_xr import (
+    build_stats,
+    config,
+    decompress_dataset,
+    from_cache,
+    write_manifest,
+)
+from wps_xr.cache import _read_registered
+from wps_xr.manifest import _read_manifest
+from wps_xr.mosaic import _find_mosaic
+from wps_xr.wps import open_dataset
+
+pytest.importorskip("zarr")
+
+test_files = Path(__file__).parents[0] / "test_files"
+BBOX = (-179.9, -89.9, -169, -85)
+
+# xarray writes NetCDF4 with netCDF4, or else with h5netcdf, which needs h5py
+netcdf = pytest.mark.skipif(
+    not any(
+        all(importlib.util.find_spec(lib) for lib in libs)
+        for libs in [["netCDF4"], ["h5netcdf", "h5py"]]
+    ),
+    reason="needs netCDF4 or h5netcdf",
+)
+
+
+@pytest.fixture
+def usgs_dir(tmp_path):
+    dn = tmp_path / "usgs"
+    shutil.copytree(test_files / "usgs", dn)
+    return dn
+
+
+def from_tiles(ds):
+    mosaic, _ = _find_mosaic(ds[list(ds.data_vars)[0]])
+    return mosaic is not None
+
+
+@pytest.mark.parametrize("name", ["cache.zarr", pytest.param("cache.nc", marks=netcdf)])
+def test_from_cache(usgs_dir, tmp_path, name):
+    ds = open_dataset(usgs_dir)
+    assert ds.wps.to_cache(tmp_path / name)
+
+    config.set({"index": {}})
+    cache = from_cache(tmp_path / name)
+    assert not from_tiles(cache)
+    assert cache.usgs.chunks == ds.usgs.chunks
+    assert cache.usgs.dtype == ds.usgs.dtype
+    assert (cache.usgs.values == ds.usgs.values).all()
+    assert cache.usgs.attrs == ds.usgs.attrs
+    assert cache.attrs == ds.attrs
+    assert config.get("index.type") == "categorical"
+    assert cache.usgs.encoding["preferred_chunks"] == {"y": (1200,), "x": (1200, 1200)}
+    chunks = from_cache(tmp_path / name, chunks=600).usgs.chunks
+    assert chunks == ((600, 600), (600,) * 4)
+
+
+def test_from_cache_invalid(tmp_path):
+    open_dataset(test_files / "usgs").to_zarr(tmp_path / "plain.zarr")
+    with pytest.raises(ValueError):
+        from_cache(tmp_path / "plain.zarr")
+
+
+@pytest.mark.parametrize("name", ["cache.zarr", pytest.param("cache.nc", marks=netcdf)])
+def test_open_fresh_cache(usgs_dir, tmp_path, name):
+    ds = open_dataset(usgs_dir)
+    write_manifest(usgs_dir)
+    expected = open_dataset(usgs_dir, bbox=BBOX)
+    ds.wps.to_cache(tmp_path / name)
+    assert _read_registered(usgs_dir)["var"] == "usgs"
+    # registering the cache keeps the manifest valid
+    assert _read_manifest(usgs_dir) is not None
+
+    cached = open_dataset(usgs_dir)
+    assert not from_tiles(cached)
+    assert cached.equals(ds)
+    assert cached.usgs.attrs == ds.usgs.attrs
+    assert open_dataset(usgs_dir, chunks={"x": 600}).usgs.chunks[1] == (600,) * 4
+    cropped = open_dataset(usgs_dir, bbox=BBOX)
+    assert not from_tiles(cropped)
+    assert cropped.equals(expected)
+    with pytest.raises(ValueError):
+        open_dataset(usgs_dir, bbox=(0, 0, 1, 1))
+    # the cache can be bypassed
+    with config.set({"cache.use": False}):
+        assert from_tiles(open_dataset(usgs_dir))
+
+
+def test_stale_cache(usgs_dir, tmp_path):
+    ds = open_dataset(usgs_dir)
+    ds.wps.to_cache(tmp_path / "cache.zarr")
+    fn = usgs_dir / "00001-01200.00001-01200"
+    stat = fn.stat()
+    os.utime(fn, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert from_tiles(open_dataset(usgs_dir))
+
+    ds.wps.to_cache(tmp_path / "cache.zarr")
+    assert not from_tiles(open_dataset(usgs_dir))
+    stat = (usgs_dir / "index").stat()
+    os.utime(usgs_dir / "index", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert from_tiles(open_dataset(usgs_dir))
+
+
+def test_stale_cache_decoding(usgs_dir, tmp_path):
+    with open(usgs_dir / "index", "a") as f:
+        f.write("missing_value=0\n")
+    with config.set({"backend.decode_policy": "compact"}):
+        ds = open_dataset(usgs_dir)
+        assert ds.usgs.dtype == "uint8"
+        ds.wps.to_cache(tmp_path / "cache.zarr")
+        assert not from_tiles(open_dataset(usgs_dir))
+        with config.set({"backend.native_endian": False}):
+            assert from_tiles(open_dataset(usgs_dir))
+    # the cached data is no longer what the tiles decode to
+    reopened = open_dataset(usgs_dir)
+    assert from_tiles(reopened)
+    assert reopened.usgs.dtype == "float64"
+
+
+def test_modified_data_is_not_registered(usgs_dir, tmp_path):
+    ds = open_dataset(usgs_dir)
+    ds["usgs"] = ds.usgs.where(ds.usgs != 16, 17)
+    assert not ds.wps.to_cache(tmp_path / "modified.zarr")
+    assert not ds.isel(x=slice(0, 1200)).wps.to_cache(tmp_path / "cropped.zarr")
+    assert _read_registered(usgs_dir) is None
+    assert from_tiles(open_dataset(usgs_dir))
+    # the cache can still be opened explicitly
+    assert (from_cache(tmp_path / "modified.zarr").usgs != 16).all()
+
+
+def test_from_cache_to_disk(tmp_path):
+    ds = open_dataset(test_files / "usgs")
+    ds.wps.to_disk(tmp_path / "reference")
+    ds.chunk({"x": 300, "y": 400}).wps.to_cache(tmp_path / "cache.zarr")
+
+    cache = from_cache(tmp_path / "cache.zarr")
+    assert cache.usgs.chunks == ((400,) * 3, (300,) * 8)
+    cache.wps.to_disk(tmp_path / "usgs")
+    for fn in (tmp_path / "reference").iterdir():
+        if fn.name in ["index"] or fn.name[0].isdigit():
+            assert fn.read_bytes() == (tmp_path / "usgs" / fn.name).read_bytes()
+    with open(tmp_path / "usgs" / config.get("stats.filename")) as f:
+        assert len(json.load(f)["tiles"]) == 2
+
+
+def test_build_stats_with_cache(usgs_dir, tmp_path):
+    open_dataset(usgs_dir).wps.to_cache(tmp_path / "cache.zarr")
+    build_stats(usgs_dir)
+    with open(usgs_dir / config.get("stats.filename")) as f:
+        assert len(json.load(f)["tiles"]) == 2
+    # the statistics don't make the cache stale
+    assert not from_tiles(open_dataset(usgs_dir))
+
+
+def test_decompress_dataset_with_cache(usgs_dir, tmp_path):
+    open_dataset(usgs_dir).wps.to_cache(tmp_path / "cache.zarr")
+    decompress_dataset(usgs_dir, tmp_path / "copy")
+    for fn in usgs_dir.glob("?????-?????.?????-?????"):
+        assert fn.read_bytes() == (tmp_path / "copy" / fn.name).read_bytes()
+    assert not (tmp_path / "copy" / config.get("cache.filename")).exists()
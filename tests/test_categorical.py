@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from wps_xr.categorical import category_fractions, category_histogram
+
+
+@pytest.fixture(params=["float", "sentinel"])
+def categories(request):
+    rng = np.random.default_rng(0)
+    arr = rng.integers(1, 6, (12, 20)).astype(float)
+    arr[rng.random(arr.shape) < 0.2] = np.nan
+    # 0 is used as sentinel outside of the category range
+    arr = arr if request.param == "float" else np.nan_to_num(arr).astype("int8")
+    da = xr.DataArray(
+        arr,
+        dims=("y", "x"),
+        coords={"y": np.arange(1, 13), "x": np.arange(1, 21)},
+        attrs={"type": "categorical", "category_min": 1, "category_max": 6},
+    )
+    ds = xr.Dataset({"landuse": da}).chunk({"y": 6, "x": 10})
+    return ds, np.where(arr == 0, np.nan, arr)
+
+
+def reference_fractions(arr, factor):
+    ny, nx = arr.shape[0] // factor[1], arr.shape[1] // factor[0]
+    out = np.full((ny, nx, 6), np.nan)
+    for j in range(ny):
+        for i in range(nx):
+            cell = arr[
+                j * factor[1] : (j + 1) * factor[1], i * factor[0] : (i + 1) * factor[0]
+            ]
+            cell = cell[~np.isnan(cell)]
+            if cell.size:
+                out[j, i] = [(cell == c).mean() for c in range(1, 7)]
+    return out
+
+
+@pytest.mark.parametrize("factor", [2, (5, 3), (4, 4)])
+def test_category_fractions(categories, factor):
+    ds, arr = categories
+    res = ds.wps.category_fractions(factor)
+    factor = (factor, factor) if np.ndim(factor) == 0 else factor
+    assert res.dims == ("y", "x", "category")
+    assert (res.category.values == np.arange(1, 7)).all()
+    assert res.x.values[0] == np.arange(1, factor[0] + 1).mean()
+    assert np.allclose(res.values, reference_fractions(arr, factor), equal_nan=True)
+
+
+def test_category_histogram(categories):
+    ds, arr = categories
+    expected = [(arr == c).sum() for c in range(1, 7)]
+    assert (ds.wps.category_histogram().values == expected).all()
+
+    sub = arr[2:8, 3:15]
+    expected = [(sub == c).sum() for c in range(1, 7)]
+    region = {"y": slice(3, 8), "x": slice(4, 15)}
+    assert (ds.wps.category_histogram(region).values == expected).all()
+
+    mask = (ds.x > 3) & (ds.x < 16) & (ds.y > 2) & (ds.y < 9)
+    assert (ds.wps.category_histogram(mask).values == expected).all()
+
+
+def test_not_categorical(categories):
+    ds, _ = categories
+    ds.landuse.attrs["type"] = "continuous"
+    with pytest.raises(ValueError):
+        category_fractions(ds.landuse, 2)
+    with pytest.raises(ValueError):
+        category_histogram(ds.landuse)
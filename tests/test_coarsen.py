@@ -0,0 +1,74 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from wps_xr import config
+from wps_xr.coarsen import _mean_kernel
+from wps_xr.wps import open_dataset
+
+test_files = Path(__file__).parents[0] / "test_files"
+
+
+def reference_mode(arr, factor):
+    ny, nx = arr.shape[0] // factor, arr.shape[1] // factor
+    out = np.empty((ny, nx), arr.dtype)
+    for j in range(ny):
+        for i in range(nx):
+            cell = arr[j * factor : (j + 1) * factor, i * factor : (i + 1) * factor]
+            out[j, i] = np.bincount(cell.ravel()).argmax()
+    return out
+
+
+def test_coarsen_mode():
+    ds = open_dataset(test_files / "usgs")
+    coarse = ds.wps.coarsen(40)
+    # every tile is coarsened on its own
+    assert coarse.usgs.chunks == ((30,), (30, 30))
+    assert coarse.usgs.dtype == ds.usgs.dtype
+    assert (coarse.usgs.values == reference_mode(ds.usgs.values, 40)).all()
+    assert np.allclose(coarse.lat, ds.lat.coarsen(y=40).mean())
+    assert np.allclose(coarse.lon, ds.lon.coarsen(x=40).mean())
+    assert config.get("index.tile_x") == coarse.usgs.attrs["tile_x"] == 30
+    assert config.get("index.dx") == coarse.attrs["dx"] == ds.attrs["dx"] * 40
+
+
+def test_coarsen_mean():
+    rng = np.random.default_rng(0)
+    arr = rng.random((12, 20))
+    arr[rng.random(arr.shape) < 0.3] = np.nan
+    arr[:3, :4] = np.nan
+    da = xr.DataArray(arr, dims=("y", "x"))
+    expected = da.coarsen(y=3, x=4).mean()
+    res = _mean_kernel(arr, (4, 3))
+    assert np.isnan(res[0, 0])
+    assert np.allclose(res, expected, equal_nan=True)
+
+    # additional z-levels are kept
+    arr3d = np.stack([arr, 2 * arr], axis=-1)
+    res3d = _mean_kernel(arr3d, (4, 3))
+    assert res3d.shape == (4, 5, 2)
+    assert np.allclose(res3d[..., 1], 2 * expected, equal_nan=True)
+
+
+@pytest.mark.parametrize("factor", [(10, 20), 7])
+def test_coarsen_to_disk(tmp_path, factor):
+    ds = open_dataset(test_files / "usgs").isel(x=slice(1200, None))
+    coarse = ds.wps.coarsen(factor)
+    coarse.wps.to_disk(tmp_path / "usgs_coarse")
+
+    res = open_dataset(tmp_path / "usgs_coarse")
+    assert (res.x == coarse.x).all() and (res.y == coarse.y).all()
+    assert np.allclose(res.lat, coarse.lat)
+    assert np.allclose(res.lon, coarse.lon)
+    assert (res.usgs_coarse.values == coarse.usgs.values).all()
+
+
+def test_coarsen_invalid_method():
+    ds = open_dataset(test_files / "usgs")
+    with pytest.raises(ValueError):
+        ds.wps.coarsen(10, method="median")
+    ds.usgs.attrs["type"] = "continuous"
+    with pytest.raises(ValueError):
+        ds.wps.coarsen(10, method="mode")
@@ -0,0 +1,149 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from wps_xr import compression, config, decompress_dataset
+from wps_xr.compression import _prefetch, _tile_cache
+from wps_xr.manifest import _read_manifest
+from wps_xr.wps import open_dataset
+
+test_files = Path(__file__).parents[0] / "test_files"
+
+
+@pytest.fixture
+def count_decompressions(monkeypatch):
+    _tile_cache.clear()
+    calls = []
+    decompress_file = compression._decompress_file
+
+    def _count(filename):
+        calls.append(Path(filename).name)
+        return decompress_file(filename)
+
+    monkeypatch.setattr(compression, "_decompress_file", _count)
+    yield calls
+    _tile_cache.clear()
+
+
+@pytest.mark.parametrize(
+    "codec,suffix", [("gzip", ".gz"), ("lzma", ".xz"), ("bz2", ".bz2")]
+)
+def test_to_disk_compressed(tmp_path, codec, suffix):
+    dataset = open_dataset(test_files / "usgs").load()
+    dn = tmp_path / "usgs"
+    dataset.wps.to_disk(dn, tile_size=(1200, 600), compression=codec)
+    names = sorted(fn.name for fn in dn.iterdir() if fn.name[0].isdigit())
+    assert names == [
+        f"{x}.{y}{suffix}"
+        for x in ["00001-01200", "01201-02400"]
+        for y in ["00001-00600", "00601-01200"]
+    ]
+    assert all((dn / name).stat().st_size < 1200 * 600 for name in names)
+    assert len(_read_manifest(dn)) == 4
+
+    ds = open_dataset(dn)
+    assert ds.usgs.chunks == ((600, 600), (1200, 1200))
+    assert (ds.usgs.values == dataset.usgs.values).all()
+    summary = ds.wps.summary()
+    assert summary.histogram.sum() == 1200 * 2400
+
+
+@pytest.mark.parametrize("read_mode", ["memmap", "pread", "fromfile"])
+def test_compressed_3d(tmp_path, read_mode):
+    dataset = open_dataset(test_files / "synthetic3d_flipped")
+    config.set({"index.missing_value": 0})
+    dn = tmp_path / "synthetic3d"
+    dataset.wps.to_disk(dn, tile_size=(5, 5), tile_bdr=1, compression="lzma")
+    assert len(list(dn.glob("*.xz"))) == 4
+
+    with config.set({"backend.read_mode": read_mode}):
+        ds = open_dataset(dn)
+        assert (ds.synthetic3d.values == dataset.synthetic3d_flipped.values).all()
+        lats, lons = ds.lat.values[[0, 3, 7]], ds.lon.values[[9, 4, 2]]
+        sampled = ds.wps.sample(lats, lons)
+        expected = dataset.synthetic3d_flipped.values[[0, 3, 7], [9, 4, 2]]
+        assert (sampled.values == expected).all()
+        # the on-disk halo is decompressed along with the tile
+        smoothed = ds.wps.map_overlap(lambda arr: arr, depth=1)
+        assert (smoothed.values == ds.synthetic3d.values).all()
+    config.set({"index.tile_bdr": 0})
+
+
+def test_tile_cache(tmp_path, count_decompressions):
+    dataset = open_dataset(test_files / "usgs").load()
+    dn = tmp_path / "usgs"
+    dataset.wps.to_disk(dn, tile_size=(600, 600), compression="gzip")
+    ds = open_dataset(dn)
+    ds.usgs.isel(x=slice(0, 10), y=slice(0, 10)).values
+    ds.usgs.isel(x=slice(10, 20), y=slice(0, 10)).values
+    assert count_decompressions == ["00001-00600.00001-00600.gz"]
+
+    with config.set({"compression.cache_size": 0}):
+        ds.usgs.isel(x=slice(600, 610), y=slice(0, 10)).values
+        ds.usgs.isel(x=slice(600, 610), y=slice(0, 10)).values
+    assert count_decompressions.count("00601-01200.00001-00600.gz") == 2
+
+    _tile_cache.clear()
+    count_decompressions.clear()
+    _prefetch(sorted(dn.glob("*.gz")))
+    assert len(count_decompressions) == 8
+    ds.usgs.values
+    assert len(count_decompressions) == 8
+
+
+def test_to_disk_compression_invalid(tmp_path):
+    dataset = open_dataset(test_files / "usgs")
+    with pytest.raises(ValueError):
+        dataset.wps.to_disk(tmp_path / "usgs", compression="zstd")
+
+
+def test_decompress_dataset(tmp_path):
+    arr = np.full((8, 12), np.nan)
+    # doesn't reach the halo of any other tile
+    arr[:3, :5] = np.arange(15).reshape(3, 5)
+    ds = xr.Dataset(
+        {"depth": (("y", "x"), arr)},
+        coords={"y": np.arange(1, 9), "x": np.arange(1, 13)},
+    )
+    config.set(
+        {
+            "index": {
+                **config.get("index_defaults"),
+                "type": "continuous",
+                "projection": "regular_ll",
+                "dx": 1,
+                "dy": 1,
+                "known_lat": 0,
+                "known_lon": 0,
+                "wordsize": 2,
+                "signed": "yes",
+                "missing_value": -1,
+            }
+        }
+    )
+    ds.wps.to_disk(tmp_path / "raw", tile_size=(6, 4), tile_bdr=1)
+    ds.wps.to_disk(
+        tmp_path / "depth",
+        tile_size=(6, 4),
+        tile_bdr=1,
+        skip_empty_tiles=True,
+        compression="bz2",
+    )
+    assert len(list((tmp_path / "depth").glob("*.bz2"))) == 1
+
+    decompress_dataset(tmp_path / "depth", tmp_path / "copy")
+    # absent tiles are written as well
+    for fn in (tmp_path / "raw").glob("?????-?????.?????-?????"):
+        assert fn.read_bytes() == (tmp_path / "copy" / fn.name).read_bytes()
+    shutil.copyfile(tmp_path / "raw" / "index", tmp_path / "raw.index")
+    assert (tmp_path / "copy" / "index").read_text() == (
+        tmp_path / "raw.index"
+    ).read_text()
+
+    copy = open_dataset(tmp_path / "copy")
+    assert np.array_equal(copy["copy"].values, arr, equal_nan=True)
+    assert copy.wps.summary()["sum"] == np.nansum(arr)
+    config.set({"index.tile_bdr": 0})
@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from wps_xr import write_manifest
+from wps_xr.config import config
+from wps_xr.manifest import _find_tiles, _read_manifest
+from wps_xr.wps import open_dataset
+
+test_files = Path(__file__).parents[0] / "test_files"
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    dn = tmp_path / "usgs"
+    shutil.copytree(test_files / "usgs", dn)
+    open_dataset(dn)
+    config.set({"manifest.use": True, "manifest.check_tiles": False})
+    return dn
+
+
+def touch_dir(dn, seconds):
+    stat = dn.stat()
+    os.utime(dn, ns=(stat.st_atime_ns, stat.st_mtime_ns + int(seconds * 1e9)))
+
+
+def test_write_manifest(dataset_dir):
+    write_manifest(dataset_dir)
+    with open(dataset_dir / config.get("manifest.filename")) as f:
+        manifest = json.load(f)
+    assert [tile["name"] for tile in manifest["tiles"]] == [
+        "00001-01200.00001-01200",
+        "01201-02400.00001-01200",
+    ]
+    assert manifest["tiles"][1]["x"] == [1201, 2400]
+    assert manifest["tiles"][1]["size"] == 1200 * 1200
+
+    extents = _read_manifest(dataset_dir)
+    assert extents[dataset_dir / "01201-02400.00001-01200"] == ((1201, 2400), (1, 1200))
+
+
+def test_open_dataset_from_manifest(dataset_dir, monkeypatch):
+    expected = open_dataset(dataset_dir)
+    write_manifest(dataset_dir)
+
+    def _no_listing(*args, **kwargs):
+        raise AssertionError("The directory should not be listed.")
+
+    monkeypatch.setattr(Path, "glob", _no_listing)
+    ds = open_dataset(dataset_dir)
+    assert ds.usgs.shape == expected.usgs.shape
+    assert (
+        ds.usgs.isel(x=slice(1190, 1210)) == expected.usgs.isel(x=slice(1190, 1210))
+    ).all()
+
+
+def test_manifest_stale(dataset_dir):
+    assert _read_manifest(dataset_dir) is None
+    assert isinstance(_find_tiles(dataset_dir), list)
+
+    write_manifest(dataset_dir)
+    assert isinstance(_find_tiles(dataset_dir), dict)
+    config.set({"manifest.use": False})
+    assert isinstance(_find_tiles(dataset_dir), list)
+
+    # tiles added or removed after the manifest modify the directory
+    touch_dir(dataset_dir, 10)
+    assert _read_manifest(dataset_dir) is None
+
+
+def test_manifest_check_tiles(dataset_dir):
+    write_manifest(dataset_dir)
+    with open(dataset_dir / "00001-01200.00001-01200", "ab") as f:
+        f.write(b"\0")
+    assert _read_manifest(dataset_dir) is not None
+    config.set({"manifest.check_tiles": True})
+    assert _read_manifest(dataset_dir) is None
@@ -0,0 +1,227 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from wps_xr.backend_array import DecodedBackendArray
+from wps_xr.config import config
+from wps_xr.mosaic import (
+    MosaicBackendArray,
+    _crop_mosaic,
+    _crop_sizes,
+    _find_mosaic,
+    _open_mosaic,
+    _tile_aligned_chunks,
+    _tile_grid,
+)
+
+test_files = Path(__file__).parents[0] / "test_files"
+
+
+def write_tiles(dirname, arr, tile_size):
+    """Writes a (y, x) array as unpadded tiles of size (x, y)."""
+    for y in range(0, arr.shape[0], tile_size[1]):
+        for x in range(0, arr.shape[1], tile_size[0]):
+            tile = arr[y : y + tile_size[1], x : x + tile_size[0]]
+            fn = (
+                f"{x + 1:05d}-{x + tile.shape[1]:05d}."
+                f"{y + 1:05d}-{y + tile.shape[0]:05d}"
+            )
+            tile.tofile(dirname / fn)
+    return sorted(dirname.glob("?????-?????.?????-?????"))
+
+
+@pytest.fixture
+def mosaic(tmp_path):
+    config.set({"index.tile_bdr": 0, "index.row_order": "bottom_top"})
+    config.set({"index.filename_digits": 5})
+    arr = np.arange(6 * 12).reshape(6, 12).astype(">i2")
+    filenames = write_tiles(tmp_path, arr, (4, 3))
+    return arr, filenames
+
+
+@pytest.mark.parametrize(
+    "filenames",
+    [
+        [],
+        ["00001-00010.00001-00010", "00005-00015.00001-00010"],
+        ["00001-00010.00001-00010", "00012-00020.00001-00010"],
+        ["00001-00010.00001-00010", "00011-00020.00011-00020"],
+    ],
+)
+def test_tile_grid_invalid(filenames):
+    with pytest.raises(ValueError):
+        _tile_grid(filenames)
+
+
+def test_tile_grid(mosaic):
+    _, filenames = mosaic
+    x_ranges, y_ranges, tiles = _tile_grid(filenames)
+    assert x_ranges == [(1, 4), (5, 8), (9, 12)]
+    assert y_ranges == [(1, 3), (4, 6)]
+    assert tiles[(1, 2)].name == "00009-00012.00004-00006"
+
+
+def test_tile_grid_fill_holes(mosaic):
+    _, filenames = mosaic
+    filenames = [fn for fn in filenames if fn.name != "00005-00008.00001-00003"]
+    with pytest.raises(ValueError):
+        _tile_grid(filenames)
+    _, _, tiles = _tile_grid(filenames, fill_holes=True)
+    assert tiles[(0, 1)] == filenames[0].parent / "00005-00008.00001-00003"
+
+
+@pytest.mark.parametrize("read_mode", ["memmap", "pread", "fromfile"])
+def test_mosaic_indexing(mosaic, read_mode):
+    config.set({"backend.read_mode": read_mode})
+    arr, filenames = mosaic
+    test_arr = MosaicBackendArray(*_tile_grid(filenames), arr.dtype)
+    assert test_arr.shape == arr.shape
+
+    # xarray only passes slices with positive steps to BASIC backends
+    keys = [
+        (slice(None), slice(None)),
+        (slice(0, 3), slice(4, 8)),
+        (slice(1, 5), slice(2, 11)),
+        (slice(None, None, 2), slice(1, None, 3)),
+        (4, slice(3, 9)),
+        (slice(2, 2), slice(None)),
+        (2, 7),
+    ]
+    for key in keys:
+        raw_key_test(test_arr, arr[key], key)
+
+    if read_mode == "fromfile":
+        return
+    raw_key_test(
+        test_arr, arr[::-1, 10:0:-4], (slice(None, None, -1), slice(10, 0, -4))
+    )
+    raw_key_test(
+        test_arr,
+        arr[np.ix_([0, 2, 5], [1, 4, 11])],
+        (np.array([0, 2, 5]), np.array([1, 4, 11])),
+    )
+    raw_key_test(test_arr, arr[1, [0, 9]], (1, np.array([0, 9])))
+
+
+def raw_key_test(test_arr, expected, key):
+    res = test_arr._raw_indexing_method(key)
+    assert res.shape == expected.shape, key
+    assert (res == expected).all(), key
+
+
+def test_open_mosaic(mosaic):
+    arr, filenames = mosaic
+    ds = _open_mosaic(filenames, arr.dtype)
+    assert ds.foo.dims == ("y", "x")
+    assert ds.foo.chunks == ((3, 3), (4, 4, 4))
+    assert (ds.x.values == np.arange(1, 13)).all()
+    assert (ds.y.values == np.arange(1, 7)).all()
+    assert (ds.foo.values == arr).all()
+
+
+def test_find_mosaic(mosaic):
+    arr, filenames = mosaic
+    ds = _open_mosaic(filenames, arr.dtype, missing_value=5)
+    found, decoded = _find_mosaic(ds.foo)
+    assert isinstance(found, MosaicBackendArray)
+    assert isinstance(decoded, DecodedBackendArray) and decoded.array is found
+    assert _find_mosaic(_open_mosaic(filenames, arr.dtype).foo)[1] is None
+
+    # modified data keeps the encoding, but can't be read from the tiles anymore
+    modified = [
+        ds.foo.isel(x=slice(0, 4)),
+        ds.foo.copy(data=ds.foo.data + 1),
+        ds.foo.chunk({"x": 6}),
+        ds.foo.load(),
+        _crop_mosaic(ds, (1, 4), (1, 6)).foo,
+    ]
+    for var in modified:
+        assert _find_mosaic(var) == (None, None)
+
+
+@pytest.mark.parametrize("decode_dtype", [None, "float32"])
+def test_open_mosaic_decoded(mosaic, decode_dtype):
+    arr, filenames = mosaic
+    ds = _open_mosaic(
+        filenames,
+        arr.dtype,
+        missing_value=5,
+        scale_factor=0.5,
+        decode_dtype=decode_dtype,
+    )
+    expected = np.where(arr == 5, np.nan, arr * 0.5)
+    assert ds.foo.dtype == np.dtype(decode_dtype or "float64")
+    # masking and scaling don't add layers to the graph
+    assert len(ds.foo.data.dask.layers) == 2
+    assert np.array_equal(ds.foo.values, expected, equal_nan=True)
+    assert np.isnan(ds.foo.isel(x=5, y=0).values)
+    assert ds.foo.isel(x=11, y=5).values == arr[5, 11] * 0.5
+
+
+def test_open_mosaic_decoded_int(mosaic):
+    arr, filenames = mosaic
+    ds = _open_mosaic(filenames, arr.dtype, scale_factor=2, decode_dtype="int32")
+    assert ds.foo.dtype == np.int32
+    assert (ds.foo.values == arr * 2).all()
+    with pytest.raises(ValueError):
+        _open_mosaic(filenames, arr.dtype, missing_value=5, decode_dtype="int32")
+
+
+@pytest.mark.parametrize(
+    "tile_sizes,size,expected",
+    [
+        ((4, 4, 4), None, (4, 4, 4)),
+        ((4, 4, 4), -1, (12,)),
+        ((4, 4, 4), 2, (2, 2, 2, 2, 2, 2)),
+        ((4, 4, 4), 3, (3, 1, 3, 1, 3, 1)),
+        ((4, 4, 4), 8, (8, 4)),
+        ((4, 4, 4), 100, (12,)),
+        ((3, 3), 4, (3, 3)),
+    ],
+)
+def test_tile_aligned_chunks(tile_sizes, size, expected):
+    assert _tile_aligned_chunks(tile_sizes, size) == expected
+
+
+def test_tile_aligned_chunks_invalid():
+    with pytest.raises(ValueError):
+        _tile_aligned_chunks((4,), 0)
+
+
+@pytest.mark.parametrize(
+    "start,stop,expected",
+    [(0, 12, (4, 4, 4)), (1, 11, (3, 4, 3)), (5, 7, (2,)), (4, 8, (4,))],
+)
+def test_crop_sizes(start, stop, expected):
+    assert _crop_sizes((4, 4, 4), start, stop) == expected
+
+
+@pytest.mark.parametrize(
+    "chunks,expected",
+    [
+        (None, ((3, 3), (4, 4, 4))),
+        (-1, ((6,), (12,))),
+        ({"x": 8, "y": 6}, ((6,), (8, 4))),
+        ({"y": 2}, ((2, 1, 2, 1), (4, 4, 4))),
+    ],
+)
+def test_open_mosaic_chunks(mosaic, chunks, expected):
+    arr, filenames = mosaic
+    ds = _open_mosaic(filenames, arr.dtype, chunks=chunks)
+    assert ds.foo.chunks == expected
+    assert (ds.foo.values == arr).all()
+
+
+@pytest.mark.parametrize("read_mode", ["memmap", "pread", "fromfile"])
+@pytest.mark.parametrize("native_endian", [True, False])
+def test_mosaic_native_endian(mosaic, read_mode, native_endian):
+    config.set({"backend.read_mode": read_mode, "backend.native_endian": native_endian})
+    arr, filenames = mosaic
+    test_arr = MosaicBackendArray(*_tile_grid(filenames), arr.dtype)
+    assert test_arr.dtype.isnative == native_endian
+    for key in [(slice(None), slice(None)), (slice(0, 3), slice(4, 8))]:
+        res = test_arr._raw_indexing_method(key)
+        assert res.dtype == test_arr.dtype
+        assert (res == arr[key]).all()
+    config.set({"backend.native_endian": True})
@@ -0,0 +1,101 @@
+import shutil
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+import xarray as xr
+
+from wps_xr import build_overviews, config
+from wps_xr.manifest import _read_manifest
+from wps_xr.mosaic import MosaicBackendArray
+from wps_xr.overview import _overview_tile_size
+from wps_xr.wps import WPSBackend, _available_levels, _select_overview, open_dataset
+
+test_files = Path(__file__).parents[0] / "test_files"
+
+
+@pytest.fixture(scope="module")
+def overview_dir(tmp_path_factory):
+    dn = tmp_path_factory.mktemp("overview") / "usgs"
+    shutil.copytree(test_files / "usgs", dn)
+    build_overviews(dn, levels=3)
+    return dn
+
+
+@pytest.mark.parametrize(
+    "chunk,extent,max_size,expected",
+    [
+        (150, 5400, 1200, 900),
+        (600, 1200, 1200, 1200),
+        (37, 75, 1200, 75),
+        (37, 2000, 1200, 37),
+    ],
+)
+def test__overview_tile_size(chunk, extent, max_size, expected):
+    assert _overview_tile_size(chunk, extent, max_size) == expected
+
+
+def test_build_overviews(overview_dir):
+    build_overviews(overview_dir, levels=3, force=True)
+    assert _available_levels(overview_dir) == [1, 2, 3]
+    # the dataset is still read with its own index
+    assert config.get("index.tile_x") == 1200
+    assert _read_manifest(overview_dir) is not None
+
+    base = open_dataset(overview_dir)
+    for level in [1, 2, 3]:
+        expected = base.wps.coarsen(2**level)
+        ds = open_dataset(overview_dir, level=level)
+        assert list(ds.data_vars) == ["usgs"]
+        assert ds.usgs.shape == (1200 // 2**level, 2400 // 2**level)
+        assert config.get("index.dx") == pytest.approx(base.attrs["dx"] * 2**level)
+        assert (ds.usgs.values == expected.usgs.values).all()
+        assert np.allclose(ds.lat, expected.lat)
+        assert np.allclose(ds.lon, expected.lon)
+
+    ds = xr.open_dataset(overview_dir, engine=WPSBackend, level=2)
+    assert ds.usgs.shape == (300, 600)
+
+
+def test_open_dataset_missing_level(overview_dir):
+    with pytest.raises(FileNotFoundError):
+        open_dataset(overview_dir, level=4)
+
+
+@pytest.mark.parametrize(
+    "cells,expected_level", [((500, 500), 1), ((250, 200), 2), ((250, 5000), 0)]
+)
+def test__select_overview(overview_dir, cells, expected_level):
+    base = open_dataset(overview_dir).isel(x=slice(0, 1200))
+    ds = _select_overview(base, "usgs", cells)
+    assert ds.usgs.shape == (1200 // 2**expected_level,) * 2
+    assert ds.lon.min() >= base.lon.min() and ds.lon.max() <= base.lon.max()
+    # config still holds the index of the dataset
+    assert config.get("index.tile_x") == 1200
+
+
+def test_plot_overview(overview_dir):
+    fig, ax = plt.subplots(figsize=(3, 2), dpi=100)
+    mesh = open_dataset(overview_dir).wps.plot(ax=ax)
+    # level 2 is the coarsest level with more cells than the 232x154 pixels
+    assert mesh.get_array().shape == (300, 300)
+    assert config.get("index.tile_x") == 1200
+
+
+def test_build_overviews_single_pass(tmp_path, monkeypatch):
+    dn = tmp_path / "usgs"
+    shutil.copytree(test_files / "usgs", dn)
+    shapes = []
+    raw_indexing_method = MosaicBackendArray._raw_indexing_method
+
+    def _count_reads(self, key):
+        arr = raw_indexing_method(self, key)
+        shapes.append(arr.shape)
+        return arr
+
+    monkeypatch.setattr(MosaicBackendArray, "_raw_indexing_method", _count_reads)
+    build_overviews(dn, levels=6)
+    assert _available_levels(dn) == list(range(1, 7))
+    # meta computations read empty arrays
+    assert [shape for shape in shapes if 0 not in shape] == [(1200, 1200)] * 2
@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from wps_xr import build_stats, config
+from wps_xr.backend_array import ConstantBackendArray
+from wps_xr.manifest import _read_manifest
+from wps_xr.mosaic import _find_mosaic
+from wps_xr.stats import _block_stats, _merge_stats, _read_stats
+from wps_xr.wps import open_dataset
+
+test_files = Path(__file__).parents[0] / "test_files"
+
+
+def reference_summary(arr):
+    values = arr[~np.isnan(arr)]
+    return {
+        "valid": values.size,
+        "min": values.min(),
+        "max": values.max(),
+        "sum": values.sum(),
+    }
+
+
+def check_summary(summary, arr):
+    for key, value in reference_summary(arr).items():
+        assert summary[key] == pytest.approx(value)
+    assert summary["mean"] == pytest.approx(np.nanmean(arr))
+
+
+@pytest.fixture
+def sparse_dir(tmp_path):
+    """Writes a continuous dataset whose upper right tile is entirely missing."""
+    arr = np.arange(8 * 12, dtype="float64").reshape(8, 12) * 0.5
+    arr[4:, 6:] = np.nan
+    arr[1, 1] = np.nan
+    ds = xr.Dataset(
+        {"depth": (("y", "x"), arr)},
+        coords={"y": np.arange(1, 9), "x": np.arange(1, 13)},
+    )
+    config.set(
+        {
+            "index": {
+                **config.get("index_defaults"),
+                "type": "continuous",
+                "projection": "regular_ll",
+                "dx": 1,
+                "dy": 1,
+                "known_lat": 0,
+                "known_lon": 0,
+                "wordsize": 2,
+                "signed": "yes",
+                "missing_value": -1,
+                "scale_factor": 0.5,
+            }
+        }
+    )
+    ds.wps.to_disk(tmp_path / "depth", tile_size=(6, 4))
+    return tmp_path / "depth", arr
+
+
+def test_to_disk_stats(sparse_dir):
+    dn, arr = sparse_dir
+    stats = _read_stats(dn)
+    assert sorted(stats) == sorted(fn.name for fn in dn.glob("?????-?????.?????-?????"))
+    tile = stats["00001-00006.00001-00004"]
+    assert tile["count"] == 24 and tile["valid"] == 23
+    assert tile["min"] == 0 and tile["max"] == arr[3, 5]
+    assert stats["00007-00012.00005-00008"]["valid"] == 0
+    assert _read_manifest(dn) is not None
+
+    ds = open_dataset(dn)
+    check_summary(ds.wps.summary(), arr)
+
+
+def test_empty_tiles_are_not_read(sparse_dir):
+    dn, arr = sparse_dir
+    ds = open_dataset(dn)
+    mosaic, _ = _find_mosaic(ds.depth)
+    empty = [
+        tile.filename_or_obj.name
+        for tile in mosaic.tiles.values()
+        if isinstance(tile, ConstantBackendArray)
+    ]
+    assert empty == ["00007-00012.00005-00008"]
+    assert np.array_equal(ds.depth.values, arr, equal_nan=True)
+
+    with config.set({"stats.use": False}):
+        ds = open_dataset(dn)
+    mosaic, _ = _find_mosaic(ds.depth)
+    assert not any(isinstance(t, ConstantBackendArray) for t in mosaic.tiles.values())
+
+
+def test_stale_stats(sparse_dir):
+    dn, arr = sparse_dir
+    fn = dn / "00007-00012.00005-00008"
+    values = np.full((4, 6), 7, ">i2")
+    values.tofile(fn)
+    stat = fn.stat()
+    os.utime(fn, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    arr[4:, 6:] = 3.5
+
+    ds = open_dataset(dn)
+    mosaic, _ = _find_mosaic(ds.depth)
+    assert not any(isinstance(t, ConstantBackendArray) for t in mosaic.tiles.values())
+    # the summary is computed from the data instead
+    check_summary(ds.wps.summary(), arr)
+
+    build_stats(dn)
+    assert _read_stats(dn)["00007-00012.00005-00008"]["valid"] == 24
+    assert _read_manifest(dn) is not None
+    check_summary(open_dataset(dn).wps.summary(), arr)
+
+
+def test_build_stats_categorical(tmp_path):
+    dn = tmp_path / "usgs"
+    shutil.copytree(test_files / "usgs", dn)
+    ds = open_dataset(dn)
+    ds.wps.build_stats()
+    with open(dn / config.get("stats.filename")) as f:
+        assert len(json.load(f)["tiles"]) == 2
+
+    summary = ds.wps.summary()
+    arr = ds.usgs.values
+    assert summary["count"] == arr.size
+    assert summary["min"] == arr.min() and summary["max"] == arr.max()
+    assert (summary.histogram.values == ds.wps.category_histogram().values).all()
+    assert (summary.category == np.arange(1, 29)).all()
+
+    # modified data is summarized from the data
+    ds["usgs"] = ds.usgs.where(ds.usgs != 16)
+    summary = ds.wps.summary()
+    assert summary["valid"] == (arr != 16).sum()
+    assert summary.histogram.sel(category=16) == 0
+
+
+def test_stats_3d(tmp_path):
+    ds = open_dataset(test_files / "synthetic3d_flipped")
+    expected = ds.wps.summary()
+    config.set({"index.missing_value": 0})
+    ds.wps.to_disk(tmp_path / "synthetic3d", tile_size=(5, 5), tile_bdr=1)
+    res = open_dataset(tmp_path / "synthetic3d").wps.summary()
+    for key in ["count", "valid", "min", "max", "sum"]:
+        assert res[key] == expected[key]
+    assert (res.histogram == expected.histogram).all()
+
+
+def test__merge_stats():
+    arr = np.array([[1, 2, 0], [3, 0, 0]])
+    stats = [_block_stats(arr[:, i], 0, 2, (1, 3)) for i in range(3)]
+    merged = None
+    for block_stats in stats:
+        merged = _merge_stats(merged, block_stats)
+    assert merged == _block_stats(arr, 0, 2, (1, 3))
+    assert merged == {
+        "count": 6,
+        "valid": 3,
+        "min": 2,
+        "max": 6,
+        "sum": 12.0,
+        "histogram": [1, 1, 1],
+    }
@@ -1,10 +1,18 @@
+import shutil
 from pathlib import Path
 
 import numpy as np
 import pytest
+import xarray as xr
 
+from wps_xr import mosaic
 from wps_xr.config import config
-from wps_xr.wps import _generate_dtype_from_config, open_dataset
+from wps_xr.wps import (
+    WPSBackend,
+    _generate_decoding_from_config,
+    _generate_dtype_from_config,
+    open_dataset,
+)
 
 test_files = Path(__file__).parents[0] / "test_files"
 
@@ -31,7 +39,7 @@ def test__generate_dtype(signed, wordsize, endian, expected_dtype):
     assert _generate_dtype_from_config() == np.dtype(expected_dtype)
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture
 def dataset(request):
     return open_dataset(request.param)
 
@@ -42,6 +50,7 @@ def dataset(request):
     indirect=["dataset"],
 )
 def test__add_latlon_coords(dataset, sample_size):
+    assert isinstance(dataset.lat.variable._data, np.ndarray)
     assert "lat" in dataset.variables and "lat" in dataset.coords
     assert "lon" in dataset.variables and "lon" in dataset.coords
     for x, y in zip(
@@ -136,3 +145,142 @@ def test_scale_factor(dataset, shape, rowgen, dtype):
 def test_tile_z_start_end(dataset, z_val):
     da = dataset[list(dataset.data_vars.keys())[0]]
     assert (da.z.values == z_val).all()
+
+
+def test_open_dataset_chunks():
+    ds = open_dataset(test_files / "usgs", chunks={"x": 2400, "y": 300})
+    assert ds.usgs.chunks == ((300,) * 4, (2400,))
+    # the lazy array and one task per chunk, each covering both tiles
+    assert len(ds.usgs.data.__dask_graph__()) == 5
+    expected = open_dataset(test_files / "usgs")
+    assert (
+        ds.usgs.isel(y=slice(250, 350)) == expected.usgs.isel(y=slice(250, 350))
+    ).all()
+
+
+@pytest.mark.parametrize("read_mode", ["memmap", "pread"])
+def test_open_dataset_writeable(read_mode):
+    config.set({"backend.read_mode": read_mode})
+    # a single tile is returned as read, without being assembled
+    ds = open_dataset(test_files / "usgs").isel(x=slice(0, 1200)).load()
+    ds.usgs[0, 0] = 1
+    assert ds.usgs[0, 0] == 1
+
+
+@pytest.mark.parametrize("lock", [True, False])
+def test_open_dataset_lock(lock):
+    config.set({"backend.lock": lock, "backend.read_mode": "pread"})
+    ds = open_dataset(test_files / "usgs", chunks={})
+    expected = open_dataset(test_files / "usgs")
+    tiles = mosaic._find_mosaic(ds.usgs)[0].tiles.values()
+    assert all((tile.lock is not None) == lock for tile in tiles)
+    assert (ds.usgs == expected.usgs).all()
+    config.set({"backend.lock": False, "backend.read_mode": "memmap"})
+
+
+@pytest.mark.parametrize(
+    "chunks,expected_chunks",
+    [(None, None), ({}, ((1200,), (1200, 1200))), ({"x": 2400}, ((1200,), (2400,)))],
+)
+def test_wps_engine(chunks, expected_chunks):
+    ds = xr.open_dataset(test_files / "usgs", engine=WPSBackend, chunks=chunks)
+    expected = open_dataset(test_files / "usgs")
+    assert ds.usgs.chunks == expected_chunks
+    assert ds.attrs == expected.attrs
+    assert (ds.lat == expected.lat).all()
+    assert (
+        ds.usgs.isel(x=slice(1190, 1210)) == expected.usgs.isel(x=slice(1190, 1210))
+    ).all()
+
+
+@pytest.mark.parametrize(
+    "bbox,expected_tiles",
+    [
+        ((-170, -89, -165.5, -85), ["01201-02400.00001-01200"]),
+        ((-170.3, -88.1, -170.01, -87.2), ["00001-01200.00001-01200"]),
+        (
+            (-175, -86, -165, -80),
+            ["00001-01200.00001-01200", "01201-02400.00001-01200"],
+        ),
+        ((-200, -100, -100, 0), ["00001-01200.00001-01200", "01201-02400.00001-01200"]),
+    ],
+)
+def test_open_dataset_bbox(monkeypatch, bbox, expected_tiles):
+    full = open_dataset(test_files / "usgs")
+    half = full.attrs["dx"] / 2
+    expected = full.isel(
+        x=((full.lon + half > bbox[0]) & (full.lon - half < bbox[2])).values,
+        y=((full.lat + half > bbox[1]) & (full.lat - half < bbox[3])).values,
+    )
+
+    opened = []
+    tile_grid = mosaic._tile_grid
+
+    def _record_tiles(tiles, **kwargs):
+        opened.extend(Path(fn).name for fn in tiles)
+        return tile_grid(tiles, **kwargs)
+
+    monkeypatch.setattr(mosaic, "_tile_grid", _record_tiles)
+    ds = open_dataset(test_files / "usgs", bbox=bbox)
+    assert sorted(opened) == expected_tiles
+    # chunks are still aligned with the tiles
+    assert sum(ds.usgs.chunks[1]) == expected.sizes["x"]
+    assert len(ds.usgs.chunks[1]) == len(expected_tiles)
+    assert (ds.x == expected.x).all() and (ds.y == expected.y).all()
+    assert (ds.lat == expected.lat).all() and (ds.lon == expected.lon).all()
+    assert (ds.usgs.values == expected.usgs.values).all()
+
+
+@pytest.mark.parametrize("bbox", [(-100, -89, -90, -85), (-160, -89, -170, -85)])
+def test_open_dataset_bbox_invalid(bbox):
+    with pytest.raises(ValueError):
+        open_dataset(test_files / "usgs", bbox=bbox)
+
+
+def test_wps_engine_guess_can_open():
+    assert WPSBackend().guess_can_open(test_files / "usgs")
+    assert not WPSBackend().guess_can_open(test_files / "usgs" / "index")
+
+
+@pytest.mark.parametrize(
+    "index,policy,expected",
+    [
+        ({"type": "categorical", "wordsize": 1}, "float64", (127, 1, None)),
+        ({"type": "categorical", "wordsize": 1}, "compact", (None, 1, None)),
+        (
+            {"type": "categorical", "wordsize": 1, "scale_factor": 0.5},
+            "compact",
+            (127, 0.5, "float32"),
+        ),
+        ({"type": "continuous", "wordsize": 2}, "compact", (127, 1, "float32")),
+        ({"type": "continuous", "wordsize": 4}, "compact", (127, 1, None)),
+    ],
+)
+def test__generate_decoding(index, policy, expected):
+    config.set({"index.missing_value": 127, "index.scale_factor": 1})
+    config.set({f"index.{key}": val for key, val in index.items()})
+    config.set({"backend.decode_policy": policy})
+    decoding = _generate_decoding_from_config()
+    assert (
+        decoding["missing_value"],
+        decoding["scale_factor"],
+        decoding["decode_dtype"],
+    ) == expected
+    config.set({"backend.decode_dtype": "float16"})
+    assert _generate_decoding_from_config()["decode_dtype"] == "float16"
+    config.set({"backend.decode_policy": "float64", "backend.decode_dtype": None})
+
+
+def test_compact_decoding(tmp_path):
+    shutil.copytree(test_files / "synthetic2d", tmp_path / "synthetic2d")
+    with open(tmp_path / "synthetic2d" / "index", "a") as f:
+        f.write("missing_value=-3\n")
+    config.set({"backend.decode_policy": "compact"})
+    da = open_dataset(tmp_path / "synthetic2d").synthetic2d
+    assert da.dtype == np.int8
+    assert (da.isel(y=2) == -3).all()
+
+    da = open_dataset(test_files / "synthetic2d_scaled").synthetic2d_scaled
+    assert da.dtype == np.float32
+    assert (da.isel(y=2) == -7.5).all()
+    config.set({"backend.decode_policy": "float64"})
@@ -1,14 +1,23 @@
 import math
+import os
 from itertools import product
 from pathlib import Path
 
+import matplotlib.pyplot as plt
 import numpy as np
 import pytest
 import xarray as xr
 
 from wps_xr import config
+from wps_xr.backend_array import BinaryBackendArray, ConstantBackendArray
+from wps_xr.manifest import _absent_tiles, _read_manifest
+from wps_xr.mosaic import MosaicBackendArray, _find_mosaic
 from wps_xr.wps import open_dataset
-from wps_xr.wps_accessor import _pad_data_if_needed, _prepare_wps_directory
+from wps_xr.wps_accessor import (
+    _pad_data_if_needed,
+    _prepare_wps_directory,
+    _TileWriter,
+)
 
 test_files = Path(__file__).parents[0] / "test_files"
 
@@ -46,7 +55,7 @@ def gen_expexcted_filelist(ds, tile_size):
     ]
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture
 def dataset(request):
     return open_dataset(request.param)
 
@@ -75,6 +84,7 @@ def test_to_disk(tmp_path_factory, dataset, tile_size):
         __file = dn / _file
         assert __file.exists() and __file.is_file()
         assert __file.stat().st_size == np.prod(tile_size)
+    assert (dn / config.get("manifest.filename")).is_file()
 
 
 @pytest.mark.parametrize(
@@ -124,6 +134,255 @@ def test_to_disk_err(tmp_path_factory, dataset, tile_size):
         dataset.wps.to_disk(dn, var="usgs", force=True)
 
 
+@pytest.mark.parametrize(
+    "tile_size,row_order",
+    [
+        ((1200, 1200), "bottom_top"),
+        ((600, 400), "bottom_top"),
+        ((800, 300), "top_bottom"),
+    ],
+)
+def test_to_disk_roundtrip(tmp_path_factory, tile_size, row_order):
+    dataset = open_dataset(test_files / "usgs")
+    config.set({"index.row_order": row_order})
+    dn = tmp_path_factory.mktemp("roundtrip")
+    dataset.wps.to_disk(dn, tile_size=tile_size, force=True)
+
+    ds_out = open_dataset(dn)
+    assert ds_out[dn.name].chunks == (
+        (tile_size[1],) * (1200 // tile_size[1]),
+        (tile_size[0],) * (2400 // tile_size[0]),
+    )
+    assert (ds_out[dn.name].values == dataset["usgs"].values).all()
+    config.set({"index.row_order": "bottom_top"})
+
+
+def test_to_disk_streaming(tmp_path_factory):
+    dataset = open_dataset(test_files / "usgs").load()
+    config.set({"index.missing_value": 127})
+    var = dataset["usgs"].astype(float).where(dataset["usgs"] != 16)
+
+    calls = []
+
+    def _count(block):
+        calls.append(block.shape)
+        return block
+
+    dataset["usgs"] = var.copy(data=var.chunk(600).data.map_blocks(_count))
+    dirs, num_calls = {}, {}
+    for streaming in [True, False]:
+        calls.clear()
+        dirs[streaming] = tmp_path_factory.mktemp("streaming")
+        dataset.wps.to_disk(
+            dirs[streaming], tile_size=(250, 250), force=True, streaming=streaming
+        )
+        num_calls[streaming] = calls.count((600, 600))
+    # the source is computed once when streaming, and once more to scan for NaNs
+    assert num_calls == {True: 8, False: 16}
+
+    files = sorted(dirs[True].glob("?????-?????.?????-?????"))
+    assert len(files) == 50
+    for fn in files:
+        assert fn.read_bytes() == (dirs[False] / fn.name).read_bytes()
+
+    ds_out = open_dataset(dirs[True])
+    assert (
+        ds_out[dirs[True].name].isnull().sum()
+        == var.isnull().sum() + 2500 * 1250 - 2400 * 1200
+    )
+
+
+def test_to_disk_tile_bdr(tmp_path_factory):
+    source = open_dataset(test_files / "usgs")
+    dataset = source.copy()
+    config.set({"index.missing_value": 127})
+    arr = dataset["usgs"].values
+
+    calls = []
+
+    def _count(block):
+        calls.append(block.shape)
+        return block
+
+    var = dataset["usgs"].chunk(600)
+    dataset["usgs"] = var.copy(data=var.data.map_blocks(_count))
+    dn = tmp_path_factory.mktemp("tile_bdr")
+    dataset.wps.to_disk(dn, tile_size=(250, 250), tile_bdr=2, force=True)
+    # every source chunk is computed once, although halos overlap several chunks
+    assert calls.count((600, 600)) == 8
+
+    # halos hold the neighbouring tiles and missing_value at the domain edge
+    tile = np.fromfile(dn / "00251-00500.00001-00250", "uint8").reshape(254, 254)
+    assert (tile[2:-2, 2:-2] == arr[:250, 250:500]).all()
+    assert (tile[-2:, 2:-2] == arr[250:252, 250:500]).all()
+    assert (tile[2:-2, :2] == arr[:250, 248:250]).all()
+    assert (tile[:2] == 127).all()
+
+    # datasets opened before keep reading their tiles without halo
+    assert config.get("index.tile_bdr") == 0
+    assert (source["usgs"].values == arr).all()
+
+    ds_out = open_dataset(dn)
+    assert ds_out[dn.name].attrs["tile_bdr"] == 2
+    assert (ds_out[dn.name].values[:1200, :2400] == arr).all()
+    assert (source["usgs"].values == arr).all()
+    config.set({"index.tile_bdr": 0})
+
+
+@pytest.mark.parametrize("tile_bdr", [0, 1])
+def test_to_disk_3d(tmp_path_factory, monkeypatch, tile_bdr):
+    open_dataset(test_files / "synthetic3d")
+    config.set({"index.missing_value": -128})
+    arr = np.random.default_rng(0).integers(-100, 100, (10, 12, 3)).astype("int8")
+    dataset = xr.Dataset(
+        {"green": (("y", "x", "z"), arr)},
+        coords={"y": np.arange(1, 11), "x": np.arange(1, 13), "z": [1, 2, 3]},
+    )
+
+    shapes = []
+    write_levels = _TileWriter._write_levels
+
+    def _record(self, filename, zkey, value):
+        shapes.append(value.shape)
+        write_levels(self, filename, zkey, value)
+
+    flushed = []
+    flush = np.memmap.flush
+
+    def _record_flush(self):
+        flushed.append(self.filename)
+        flush(self)
+
+    monkeypatch.setattr(_TileWriter, "_write_levels", _record)
+    monkeypatch.setattr(np.memmap, "flush", _record_flush)
+    dn = tmp_path_factory.mktemp("green")
+    dataset.wps.to_disk(dn, tile_size=(5, 4), tile_bdr=tile_bdr, force=True)
+    # every tile is written one z-level at a time, but flushed only once
+    assert shapes == [(4 + 2 * tile_bdr, 5 + 2 * tile_bdr, 1)] * 27
+    assert len(flushed) == len(set(flushed)) == 9
+
+    ds_out = open_dataset(dn)
+    da_out = ds_out[dn.name]
+    assert da_out.shape == (12, 15, 3)
+    assert (da_out.z.values == [1, 2, 3]).all()
+    assert (da_out.values[:10, :12] == arr).all()
+    assert da_out.isel(y=slice(10, None)).isnull().all()
+    config.set({"index.tile_bdr": 0})
+
+
+def set_continuous_index(**kwargs):
+    config.set(
+        {
+            "index": {
+                **config.get("index_defaults"),
+                "type": "continuous",
+                "projection": "regular_ll",
+                "dx": 1,
+                "dy": 1,
+                "known_lat": 0,
+                "known_lon": 0,
+                "wordsize": 2,
+                "signed": "yes",
+                "missing_value": -1,
+                **kwargs,
+            }
+        }
+    )
+
+
+@pytest.mark.parametrize("tile_bdr", [0, 1])
+def test_to_disk_skip_empty_tiles(tmp_path, tile_bdr):
+    arr = np.full((12, 12), np.nan)
+    arr[:4] = np.arange(48).reshape(4, 12)
+    # doesn't reach the halo of the tiles to the left and right
+    arr[6, 6] = 7
+    ds = xr.Dataset(
+        {"depth": (("y", "x"), arr)},
+        coords={"y": np.arange(1, 13), "x": np.arange(1, 13)},
+    )
+    set_continuous_index()
+    dn = tmp_path / "depth"
+    ds.wps.to_disk(dn, tile_size=(4, 4), tile_bdr=tile_bdr, skip_empty_tiles=True)
+    absent = [
+        "00001-00004.00005-00008",
+        "00001-00004.00009-00012",
+        "00005-00008.00009-00012",
+        "00009-00012.00005-00008",
+        "00009-00012.00009-00012",
+    ]
+    if tile_bdr:
+        # tiles with valid cells in their halo are written
+        absent = [name for name in absent if "00005-00008" not in name[12:]]
+    assert not any((dn / name).exists() for name in absent)
+    assert len(list(dn.glob("?????-?????.?????-?????"))) == 9 - len(absent)
+    assert _absent_tiles(dn) == absent
+
+    ds_out = open_dataset(dn)
+    mosaic, _ = _find_mosaic(ds_out.depth)
+    constants = sorted(
+        tile.filename_or_obj.name
+        for tile in mosaic.tiles.values()
+        if isinstance(tile, ConstantBackendArray)
+    )
+    assert constants == absent
+    assert np.array_equal(ds_out.depth.values, arr, equal_nan=True)
+    assert ds_out.wps.summary()["count"] == 144
+    assert ds_out.wps.summary()["sum"] == np.nansum(arr)
+
+    # without the manifest, only holes within the grid are known
+    with config.set({"manifest.use": False}):
+        ds_out = open_dataset(dn)
+    assert np.array_equal(ds_out.depth.values, arr[:8], equal_nan=True)
+    config.set({"index.tile_bdr": 0})
+
+
+def test_skip_empty_tiles_stale_manifest(tmp_path):
+    arr = np.full((8, 8), np.nan)
+    arr[:4] = np.arange(32).reshape(4, 8)
+    ds = xr.Dataset(
+        {"depth": (("y", "x"), arr)},
+        coords={"y": np.arange(1, 9), "x": np.arange(1, 9)},
+    )
+    set_continuous_index()
+    dn = tmp_path / "depth"
+    ds.wps.to_disk(dn, tile_size=(4, 4), skip_empty_tiles=True)
+    assert len(list(dn.glob("?????-?????.?????-?????"))) == 2
+
+    # any change to the directory makes the manifest stale
+    (dn / "notes.txt").write_text("")
+    stat = dn.stat()
+    os.utime(dn, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert _read_manifest(dn) is None
+    ds_out = open_dataset(dn)
+    assert ds_out.depth.shape == (8, 8)
+    assert np.array_equal(ds_out.depth.values, arr, equal_nan=True)
+
+    # absent tiles that were written since are read from disk
+    np.full((4, 4), 5, ">i2").tofile(dn / "00001-00004.00005-00008")
+    arr[4:, :4] = 5
+    assert _absent_tiles(dn) == ["00005-00008.00005-00008"]
+    ds_out = open_dataset(dn)
+    assert np.array_equal(ds_out.depth.values, arr, equal_nan=True)
+
+
+def test_to_disk_skip_empty_tiles_3d(tmp_path):
+    arr = np.full((8, 4, 2), np.nan)
+    arr[:4, :, 0] = np.arange(16).reshape(4, 4)
+    ds = xr.Dataset(
+        {"depth": (("y", "x", "z"), arr)},
+        coords={"y": np.arange(1, 9), "x": np.arange(1, 5), "z": [1, 2]},
+    )
+    set_continuous_index()
+    dn = tmp_path / "depth"
+    ds.wps.to_disk(dn, tile_size=(4, 4), skip_empty_tiles=True)
+    # the empty level of the first tile is still written
+    assert (dn / "00001-00004.00001-00004").stat().st_size == 4 * 4 * 2 * 2
+    assert not (dn / "00001-00004.00005-00008").exists()
+
+    ds_out = open_dataset(dn)
+    assert np.array_equal(ds_out.depth.values, arr, equal_nan=True)
+
+
 def test__prepare_wps_directory(tmp_path_factory):
     pth = tmp_path_factory.mktemp("tmppath")
     with pytest.raises(FileExistsError):
@@ -174,3 +433,144 @@ def test__pad_data_if_needed_keyerr(dataset, tile_size):
 )
 def test_plot(dataset):
     dataset.wps.plot()
+
+
+def test_plot_decimated(monkeypatch):
+    ds = open_dataset(test_files / "usgs")
+    shapes = []
+    raw_indexing_method = MosaicBackendArray._raw_indexing_method
+
+    def _count_reads(self, key):
+        arr = raw_indexing_method(self, key)
+        shapes.append(arr.shape)
+        return arr
+
+    monkeypatch.setattr(MosaicBackendArray, "_raw_indexing_method", _count_reads)
+
+    # the axes are 232x154 pixels
+    fig, ax = plt.subplots(figsize=(3, 2), dpi=100)
+    mesh = ds.wps.plot(ax=ax)
+    assert mesh.get_array().shape == (1200 // 7, 2400 // 10)
+    expected = ds.wps.coarsen((10, 7)).usgs
+    assert (mesh.get_array() == expected.values).all()
+
+    # only the first tile is within the limits
+    shapes.clear()
+    fig, ax = plt.subplots(figsize=(3, 2), dpi=100)
+    ax.set_xlim(-179, -175)
+    ax.set_ylim(-89, -85)
+    mesh = ds.wps.plot(ax=ax)
+    assert [shape for shape in shapes if 0 not in shape] == [(1200, 1200)]
+    assert mesh.get_array().shape == (481 // 3, 481 // 2)
+
+
+def smooth(arr):
+    out = np.zeros(arr.shape)
+    for dy, dx in product(range(3), range(3)):
+        out[1:-1, 1:-1] += arr[dy : arr.shape[0] - 2 + dy, dx : arr.shape[1] - 2 + dx]
+    return out / 9
+
+
+@pytest.fixture
+def halo_dataset(tmp_path):
+    """Writes tiles of size (4, 3) with an on-disk halo of one cell."""
+    arr = np.arange(6 * 12).reshape(6, 12) ** 2 % 97
+    padded = np.pad(arr, 1, mode="edge").astype(">i2")
+    for y in range(0, 6, 3):
+        for x in range(0, 12, 4):
+            fn = f"{x + 1:05d}-{x + 4:05d}.{y + 1:05d}-{y + 3:05d}"
+            padded[y : y + 5, x : x + 6].tofile(tmp_path / fn)
+    with open(tmp_path / "index", "w") as f:
+        f.write(
+            "type=continuous\nprojection=regular_ll\ndx=1\ndy=1\nknown_lat=0\n"
+            "known_lon=0\nwordsize=2\nsigned=yes\ntile_x=4\ntile_y=3\ntile_bdr=1\n"
+            "scale_factor=0.5\n"
+        )
+    return open_dataset(tmp_path), padded * 0.5
+
+
+def test_map_overlap_halo(halo_dataset):
+    ds, padded = halo_dataset
+    res = ds.wps.map_overlap(smooth, depth=1, dtype="float64")
+    assert res.dims == ("y", "x")
+    assert res.chunks == ((3, 3), (4, 4, 4))
+    # no neighbouring tiles are read
+    assert "overlap" not in "".join(res.data.dask.layers)
+    assert np.allclose(res.values, smooth(padded)[1:-1, 1:-1])
+
+
+def test_map_overlap_fallback(halo_dataset):
+    ds, padded = halo_dataset
+    expected = smooth(padded)[2:-2, 2:-2]
+
+    res = ds.wps.map_overlap(smooth, depth=2, dtype="float64")
+    assert np.allclose(res.values[1:-1, 1:-1], expected)
+
+    ds["modified"] = ds[list(ds.data_vars)[0]] + 0
+    res = ds.wps.map_overlap(smooth, depth=1, var="modified", dtype="float64")
+    assert "overlap" in "".join(res.data.dask.layers)
+    assert np.allclose(res.values[1:-1, 1:-1], expected)
+
+
+def sample_points(ds, n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    # stay just within the outer edges of the outermost cells
+    half_dx, half_dy = ds.attrs["dx"] * 0.49, ds.attrs["dy"] * 0.49
+    lats = rng.uniform(ds.lat.min() - half_dy, ds.lat.max() + half_dy, n)
+    lons = rng.uniform(ds.lon.min() - half_dx, ds.lon.max() + half_dx, n)
+    return lats, lons
+
+
+def nearest(ds, var, lats, lons):
+    return (
+        ds[var]
+        .swap_dims(x="lon", y="lat")
+        .sel(
+            lat=xr.DataArray(lats, dims="point"),
+            lon=xr.DataArray(lons, dims="point"),
+            method="nearest",
+        )
+    )
+
+
+@pytest.mark.parametrize("read_mode", ["memmap", "pread", "fromfile"])
+@pytest.mark.parametrize(
+    "name", ["usgs", "synthetic3d_flipped", "synthetic2d_scaled", "halo"]
+)
+def test_sample(halo_dataset, monkeypatch, read_mode, name):
+    ds = halo_dataset[0] if name == "halo" else open_dataset(test_files / name)
+    var = list(ds.data_vars)[0]
+    lats, lons = sample_points(ds)
+
+    reads = []
+    read_points = BinaryBackendArray._read_points
+
+    def _count_reads(self, rows, cols):
+        reads.append(self.filename_or_obj)
+        return read_points(self, rows, cols)
+
+    monkeypatch.setattr(BinaryBackendArray, "_read_points", _count_reads)
+    config.set({"backend.read_mode": read_mode})
+    res = ds.wps.sample(lats, lons)
+    config.set({"backend.read_mode": "memmap"})
+
+    expected = nearest(ds, var, lats, lons)
+    assert res.dims == expected.dims
+    assert res.dtype == expected.dtype
+    assert np.array_equal(res.values, expected.values, equal_nan=True)
+    assert (res.x == expected.x).all() and (res.lat == lats).all()
+    # every tile is read once
+    assert reads and sorted(reads) == sorted(set(reads))
+
+
+def test_sample_fallback():
+    ds = open_dataset(test_files / "usgs", bbox=(-175, -86, -165, -80))
+    ds["modified"] = ds.usgs + 1
+    lats, lons = sample_points(ds)
+    expected = nearest(ds, "usgs", lats, lons)
+    assert (ds.wps.sample(lats, lons, var="usgs").values == expected.values).all()
+    assert (
+        ds.wps.sample(lats, lons, var="modified").values == expected.values + 1
+    ).all()
+    with pytest.raises(ValueError):
+        ds.wps.sample([-85], [-176], var="usgs")
@@ -1,5 +1,17 @@
+from .cache import from_cache
+from .compression import decompress_dataset
 from .config import config  # noqa: F401 silence pyflakes
+from .manifest import write_manifest
+from .overview import build_overviews
+from .stats import build_stats
 from .wps import open_dataset
 from .wps_accessor import WPSAccessor  # noqa: F401 silence pyflakes
 
-__all__ = ["open_dataset"]
+__all__ = [
+    "build_overviews",
+    "build_stats",
+    "decompress_dataset",
+    "from_cache",
+    "open_dataset",
+    "write_manifest",
+]
@@ -37,7 +37,8 @@ def _create_shape_and_index_from_tile_z_start_end(_shape, _idx):
 
 def generate_shape_and_coordinate_indices(filename_or_obj):
     _idx = wps_static_filename_to_idx(filename_or_obj)
-    _shape = [_i[1] - _i[0] + 1 for _i in _idx]
+    # filenames are ordered (x, y), data is stored row-wise, i.e. (y, x)
+    _shape = [_i[1] - _i[0] + 1 for _i in _idx[::-1]]
 
     try:
         return _create_shape_and_index_from_tile_z(_shape, _idx)
@@ -56,7 +57,7 @@ class BinaryBackend(xr.backends.BackendEntrypoint):
             filename_or_obj=filename_or_obj,
             shape=shape,
             dtype=dtype,
-            lock=dask.utils.SerializableLock(),
+            lock=dask.utils.SerializableLock() if config.get("backend.lock") else None,
         )
         data = xr.core.indexing.LazilyIndexedArray(backend_array)
 
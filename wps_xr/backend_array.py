@@ -2,37 +2,189 @@
 https://github.com/aurghs/xarray-backend-tutorial/blob/main/2.Backend_with_Lazy_Loading.ipynb
 """
 
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
 import numpy as np
 import xarray as xr
 
+from .compression import _read_compressed
 from .config import config
+from .utils import _split_codec
 
 # FIXME? This backend is dependent on config. It cannot be used independently...
 
 
+_INDEXING_SUPPORT = {
+    "memmap": xr.core.indexing.IndexingSupport.OUTER,
+    "pread": xr.core.indexing.IndexingSupport.OUTER,
+    "fromfile": xr.core.indexing.IndexingSupport.BASIC,
+}
+
+
+class _OpenFile:
+    def __init__(self, handle, closer=None):
+        self.handle = handle
+        self.closer = closer
+        self.users = 0
+        self.evicted = False
+
+    def close(self):
+        if self.closer is not None:
+            self.closer(self.handle)
+        self.handle = None
+
+
+class _OpenFiles:
+    """Keeps the most recently used tiles mapped or open, up to `backend.max_open_files`.
+
+    Note:
+        Every mapping and descriptor holds a file descriptor, so reading more tiles
+        than the limit of the process would fail if all of them were kept open.
+        Evicted descriptors still in use are closed once released. Evicted mappings
+        are only dereferenced, so they are unmapped with the last view of them.
+    """
+
+    def __init__(self):
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, key, opener, closer=None):
+        """Yields the open file of `key`, opened with `opener` if it isn't open yet.
+
+        Args:
+            key (hashable): Key of the open file.
+            opener (callable): Opens the file and returns its handle.
+            closer (callable): Closes a handle. (default: None, only dereference it)
+        """
+        with self._lock:
+            entry = self._files.get(key)
+            if entry is None:
+                entry = self._files[key] = _OpenFile(opener(), closer)
+            self._files.move_to_end(key)
+            entry.users += 1
+            self._evict()
+        try:
+            yield entry.handle
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.evicted and not entry.users:
+                    entry.close()
+
+    def _evict(self):
+        while len(self._files) > config.get("backend.max_open_files"):
+            _, entry = self._files.popitem(last=False)
+            entry.evicted = True
+            if not entry.users:
+                entry.close()
+
+    def clear(self):
+        with self._lock:
+            while self._files:
+                _, entry = self._files.popitem(last=False)
+                entry.evicted = True
+                if not entry.users:
+                    entry.close()
+
+    def __len__(self):
+        return len(self._files)
+
+
+_open_files = _OpenFiles()
+
+
 def _modify_shape_to_padded(shp, bdr):
     return [_shp + 2 * bdr if i < 2 else _shp for i, _shp in enumerate(shp)]
 
 
+def _outer_indexing(arr, key):
+    """Applies an outer indexer, i.e. integer arrays index their axes independently.
+
+    Args:
+        arr (numpy.ndarray): Array to index.
+        key (tuple): Tuple of integers, slices and 1-d integer arrays.
+    """
+    arr = arr[tuple(slice(None) if isinstance(k, np.ndarray) else k for k in key)]
+    axis = 0
+    for k in key:
+        if isinstance(k, np.ndarray):
+            arr = np.take(arr, k, axis=axis)
+        if not isinstance(k, (int, np.integer)):
+            axis += 1
+    return arr
+
+
 class BinaryBackendArray(xr.backends.BackendArray):
+    """Lazily indexed array reading a single tile file.
+
+    Note:
+        The layout of the tile, i.e. its halo and row order, is taken from config
+        when the array is created, so later changes to config, e.g. by opening or
+        writing another dataset, don't affect how the tile is read.
+
+    Args:
+        filename_or_obj (str,pathlib.Path): Filename of the tile.
+        shape (list of int): Shape of the tile without halo, in (y, x, ...) order.
+        dtype (str,numpy.dtype): Datatype of the tile.
+        lock (Lock or None): Lock around file access, or None for lock-free reads.
+        tile_bdr (int): Width of the halo stored around the tile.
+            (default: "index.tile_bdr" from config)
+        row_order (str): "bottom_top" or "top_bottom".
+            (default: "index.row_order" from config)
+    """
+
     def __init__(
         self,
         filename_or_obj,
         shape,
         dtype,
         lock,
+        tile_bdr=None,
+        row_order=None,
     ):
         self.filename_or_obj = filename_or_obj
         self.shape = shape
-        self.padshp = _modify_shape_to_padded(shape, config.get("index.tile_bdr"))
+        self.tile_bdr = config.get("index.tile_bdr") if tile_bdr is None else tile_bdr
+        self.row_order = (
+            config.get("index.row_order") if row_order is None else row_order
+        )
+        self.padshp = _modify_shape_to_padded(shape, self.tile_bdr)
         self.dtype = dtype
         self.lock = lock
+        # compressed tiles are always decompressed as a whole
+        _, self.codec = _split_codec(filename_or_obj)
+        # identifies the mapping and descriptor of this tile among all open files,
+        # which are never pickled, as copies share them or reopen them lazily
+        self._key = uuid.uuid4().hex
+
+    def _lock(self):
+        """Returns the opt-in lock around file access, or a no-op context."""
+        return self.lock if self.lock is not None else nullcontext()
+
+    def _descriptor(self):
+        """Returns a context yielding the descriptor of the tile shared by all reads.
+
+        Note:
+            Positional reads (`os.pread`) don't move a shared file offset, so
+            concurrent reads through the same descriptor need no lock. The descriptor
+            stays open for later reads, as long as it is among `backend.max_open_files`.
+        """
+        return _open_files.acquire(
+            ("fd", self._key),
+            lambda: os.open(self.filename_or_obj, os.O_RDONLY),
+            os.close,
+        )
 
     def __getitem__(self, key: tuple):
         return xr.core.indexing.explicit_indexing_adapter(
             key,
             self.shape,
-            xr.core.indexing.IndexingSupport.BASIC,
+            _INDEXING_SUPPORT[config.get("backend.read_mode")],
             self._raw_indexing_method,
         )
 
@@ -40,7 +192,7 @@ class BinaryBackendArray(xr.backends.BackendArray):
         if isinstance(key, list):
             raise NotImplementedError(
                 "Advanced indexing is not implemented,"
-                "as IndexingSupport should only be BASIC."
+                "as IndexingSupport should at most be OUTER."
             )
 
         key = (
@@ -48,9 +200,149 @@ class BinaryBackendArray(xr.backends.BackendArray):
             if isinstance(key, int)
             else key
         )
+
+        read_mode = config.get("backend.read_mode")
+        if read_mode == "memmap" or self.codec is not None:
+            arr = self._read_memmap(key)
+        elif read_mode == "pread":
+            arr = self._read_pread(key)
+        else:
+            arr = self._read_fromfile(key)
+        return _writeable(arr) if config.get("backend.copy") else arr
+
+    def _tile_view(self, halo=0):
+        """Maps the tile file once and returns a view in (y, x, ...) order.
+
+        Note:
+            The mapping is kept among `backend.max_open_files`, so repeated indexing of
+            the same tile only costs page-cache hits. Halo stripping and `top_bottom`
+            row flipping are applied as views, so no data is copied here. Compressed
+            tiles are decompressed as a whole instead, and kept in a cache shared by
+            all tiles.
+
+        Args:
+            halo (int): Number of on-disk halo cells to keep around the tile, at most
+                `tile_bdr`. (default: 0)
+        """
+        if self.codec is not None:
+            tile = _read_compressed(self.filename_or_obj, self.dtype, self.padshp)
+            return self._strip_halo(tile, halo)
+        with _open_files.acquire(("memmap", self._key), self._map) as mmap:
+            return self._strip_halo(mmap, halo)
+
+    def _map(self):
+        return np.memmap(
+            self.filename_or_obj, dtype=self.dtype, mode="r", shape=tuple(self.padshp)
+        )
+
+    def _strip_halo(self, tile, halo):
+        bdr = self.tile_bdr - halo
+        arr = tile[bdr : self.padshp[0] - bdr, bdr : self.padshp[1] - bdr, ...]
+        if self.row_order == "top_bottom":
+            arr = arr[::-1, ...]
+        return arr
+
+    def _read_memmap(self, key: tuple):
+        arr = _outer_indexing(self._tile_view(), key)
+        # hand out a plain ndarray view instead of a np.memmap subclass
+        return np.asarray(arr)
+
+    def _read_pread(self, key: tuple):
+        """Reads only the byte ranges of the requested columns in every requested row.
+
+        Note:
+            Every requested row costs one positional read spanning the requested
+            x-range (including all z-levels in between). If whole rows are requested,
+            the row range is read at once instead.
+        """
         size = np.dtype(self.dtype).itemsize
-        flip_yax = config.get("index.row_order") == "top_bottom"
-        bdr = config.get("index.tile_bdr")
+        bdr = self.tile_bdr
+        # requested indices per axis, relative to the unpadded tile
+        idx = [np.arange(n)[k] for n, k in zip(self.shape, key)]
+        idx += [np.arange(n) for n in self.shape[len(key) :]]
+        rows = np.atleast_1d(idx[0]) + bdr
+        if self.row_order == "top_bottom":
+            rows = self.padshp[0] - 1 - rows
+        cols = np.atleast_1d(idx[1]) + bdr
+        if not rows.size or not cols.size:
+            return _outer_indexing(np.empty(self.shape, self.dtype), key)
+
+        row_len = int(np.prod(self.padshp[1:]))
+        trailing = tuple(self.padshp[2:])
+        col_len = int(np.prod(trailing))
+        cstart, cstop = cols.min(), cols.max() + 1
+
+        with self._descriptor() as fd, self._lock():
+            if (cstop - cstart) * col_len == row_len:
+                rstart, rstop = rows.min(), rows.max() + 1
+                buf = os.pread(
+                    fd, (rstop - rstart) * row_len * size, rstart * row_len * size
+                )
+                arr = np.frombuffer(buf, self.dtype).reshape(
+                    (rstop - rstart, self.padshp[1]) + trailing
+                )[rows - rstart]
+            else:
+                arr = np.empty((len(rows), cstop - cstart) + trailing, self.dtype)
+                for i, row in enumerate(rows):
+                    buf = os.pread(
+                        fd,
+                        (cstop - cstart) * col_len * size,
+                        (row * row_len + cstart * col_len) * size,
+                    )
+                    arr[i] = np.frombuffer(buf, self.dtype).reshape(arr.shape[1:])
+
+        arr = arr[:, cols - cstart]
+        # drop axes that were indexed with an integer, then select the z-levels
+        arr = arr[tuple(0 if np.ndim(i) == 0 else slice(None) for i in idx[:2])]
+        lead = tuple(slice(None) for i in idx[:2] if np.ndim(i) != 0)
+        return _outer_indexing(arr, lead + tuple(key[2:]))
+
+    def _read_points(self, rows, cols):
+        """Reads the cells at pairs of positions, i.e. pointwise instead of outer.
+
+        Note:
+            With `backend.read_mode: "memmap"`, the cells are gathered from the mapped
+            tile, so only the pages holding them are read, and likewise from
+            compressed tiles once decompressed. Otherwise, every distinct row costs
+            one positional read, spanning only the requested columns.
+
+        Args:
+            rows (numpy.ndarray): Row of every point, relative to the unpadded tile.
+            cols (numpy.ndarray): Column of every point, relative to the unpadded tile.
+
+        Returns:
+            values (numpy.ndarray): Values of the points, with all z-levels.
+        """
+        if config.get("backend.read_mode") == "memmap" or self.codec is not None:
+            return np.array(self._tile_view()[rows, cols])
+
+        size = np.dtype(self.dtype).itemsize
+        bdr = self.tile_bdr
+        file_rows = rows + bdr
+        if self.row_order == "top_bottom":
+            file_rows = self.padshp[0] - 1 - file_rows
+        trailing = tuple(self.padshp[2:])
+        col_len = int(np.prod(trailing))
+        row_len = self.padshp[1] * col_len
+
+        out = np.empty((len(rows),) + trailing, self.dtype)
+        with self._descriptor() as fd, self._lock():
+            for row in np.unique(file_rows):
+                sel = np.flatnonzero(file_rows == row)
+                cstart, cstop = cols[sel].min() + bdr, cols[sel].max() + bdr + 1
+                buf = os.pread(
+                    fd,
+                    (cstop - cstart) * col_len * size,
+                    (row * row_len + cstart * col_len) * size,
+                )
+                span = np.frombuffer(buf, self.dtype).reshape((-1,) + trailing)
+                out[sel] = span[cols[sel] + bdr - cstart]
+        return out
+
+    def _read_fromfile(self, key: tuple):
+        size = np.dtype(self.dtype).itemsize
+        flip_yax = self.row_order == "top_bottom"
+        bdr = self.tile_bdr
 
         if isinstance(key[0], slice):
             start = key[0].start if key[0].start is not None else 0
@@ -69,7 +361,7 @@ class BinaryBackendArray(xr.backends.BackendArray):
             count = 1 * np.prod(self.padshp[1:])
             modshape = tuple([1] + list(self.padshp[1:]))
 
-        with self.lock, open(self.filename_or_obj) as f:
+        with self._lock(), open(self.filename_or_obj) as f:
             arr = np.fromfile(f, self.dtype, offset=offset, count=count)
 
         arr = arr.reshape(modshape, order="C")
@@ -82,3 +374,126 @@ class BinaryBackendArray(xr.backends.BackendArray):
             return arr[tuple([slice(None, stop - start, key[0].step)] + list(key[1:]))]
         except NameError:
             return arr[tuple([0] + list(key[1:]))]
+
+
+class ConstantBackendArray(xr.backends.BackendArray):
+    """Tile holding a single value everywhere, which is never read from disk.
+
+    Note:
+        Without `backend.copy`, reads return read-only broadcast views, so they don't
+        even allocate memory.
+
+    Args:
+        filename_or_obj (str,pathlib.Path): Filename of the tile, only used for naming.
+        shape (tuple of int): Shape of the tile in (y, x, ...) order.
+        dtype (str,numpy.dtype): Datatype of the tile.
+        value (int): The value of every cell.
+    """
+
+    def __init__(self, filename_or_obj, shape, dtype, value):
+        self.filename_or_obj = filename_or_obj
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.value = np.array(value, self.dtype)
+
+    def __getitem__(self, key: tuple):
+        return xr.core.indexing.explicit_indexing_adapter(
+            key,
+            self.shape,
+            xr.core.indexing.IndexingSupport.OUTER,
+            self._raw_indexing_method,
+        )
+
+    def _raw_indexing_method(self, key: tuple):
+        arr = _outer_indexing(self._tile_view(), key)
+        return _writeable(arr) if config.get("backend.copy") else arr
+
+    def _tile_view(self, halo=0):
+        shape = (self.shape[0] + 2 * halo, self.shape[1] + 2 * halo) + self.shape[2:]
+        return np.broadcast_to(self.value, shape)
+
+    def _read_points(self, rows, cols):
+        return np.broadcast_to(self.value, (len(rows),) + self.shape[2:])
+
+
+def _writeable(arr):
+    """Returns the array if it may be modified, otherwise a copy of it.
+
+    Args:
+        arr (numpy.ndarray): Array read from a tile, possibly a read-only view.
+    """
+    return arr if arr.flags.writeable else np.array(arr)
+
+
+def _to_native(arr):
+    """Converts an array into native byte order, in place if it may be modified.
+
+    Args:
+        arr (numpy.ndarray): Array in any byte order.
+    """
+    if arr.dtype.isnative:
+        return arr
+    native = arr.dtype.newbyteorder("=")
+    if arr.flags.writeable:
+        return arr.byteswap(inplace=True).view(native)
+    return arr.astype(native)
+
+
+def _decode(arr, missing_value, scale_factor, dtype):
+    """Masks and scales freshly read data in one pass.
+
+    Args:
+        arr (numpy.ndarray): Raw data as stored in the tile.
+        missing_value (int or None): Raw value to replace with NaN.
+        scale_factor (float): Factor to multiply the raw data with.
+        dtype (numpy.dtype): Datatype of the decoded data.
+    """
+    out = np.multiply(arr, scale_factor, out=np.empty(np.shape(arr), dtype))
+    if missing_value is not None:
+        np.copyto(out, np.nan, where=arr == missing_value)
+    return out
+
+
+class DecodedBackendArray(xr.backends.BackendArray):
+    """Masks `missing_value` and applies `scale_factor` to every read of an array.
+
+    Note:
+        Decoding happens right after the read, so it adds neither tasks to the dask
+        graph nor full-size intermediate arrays.
+
+    Args:
+        array (xarray.backends.BackendArray): Array holding the raw data.
+        missing_value (int or None): Raw value to replace with NaN.
+        scale_factor (float): Factor to multiply the raw data with.
+        dtype (str,numpy.dtype): Datatype of the decoded data.
+
+    Raises:
+        ValueError: If values should be masked, but `dtype` can't represent NaN.
+    """
+
+    def __init__(self, array, missing_value=None, scale_factor=1, dtype="float64"):
+        self.array = array
+        self.shape = array.shape
+        self.missing_value = missing_value
+        self.scale_factor = scale_factor
+        self.dtype = np.dtype(dtype)
+        if missing_value is not None and self.dtype.kind != "f":
+            raise ValueError(
+                f"Can't mask missing values with NaN in decoded dtype {self.dtype}."
+            )
+
+    def __getitem__(self, key: tuple):
+        return xr.core.indexing.explicit_indexing_adapter(
+            key,
+            self.shape,
+            _INDEXING_SUPPORT[config.get("backend.read_mode")],
+            self._raw_indexing_method,
+        )
+
+    def _raw_indexing_method(self, key: tuple):
+        return _decode(
+            self.array._raw_indexing_method(key),
+            self.missing_value,
+            self.scale_factor,
+            self.dtype,
+        )
@@ -0,0 +1,238 @@
+"""Writes and reads analysis caches, chunked Zarr or NetCDF copies of a dataset."""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from .config import config
+from .index import _construct_index
+from .manifest import _manifest_path, _tile_files, write_manifest
+from .mosaic import _chunk_mosaic, _find_mosaic, _generate_decoding_from_config
+
+CACHE_VERSION = 2
+# global attribute holding the index of the cached dataset
+INDEX_ATTR = "wps_xr_index"
+
+
+def _cache_path(pathname_or_obj):
+    return Path(pathname_or_obj) / config.get("cache.filename")
+
+
+def _is_netcdf(path):
+    return Path(path).suffix in [".nc", ".nc4"]
+
+
+def _fingerprint(pathname_or_obj):
+    """Records the size and mtime of the `index` and of every tile of a dataset."""
+    pathname_or_obj = Path(pathname_or_obj)
+    return {
+        fn.name: [stat.st_size, stat.st_mtime_ns]
+        for fn in [pathname_or_obj / "index"] + sorted(_tile_files(pathname_or_obj))
+        for stat in [fn.stat()]
+    }
+
+
+def _decode_settings(
+    missing_value=None, scale_factor=1, decode_dtype=None, native_endian=True
+):
+    """Returns the settings tiles are decoded with, as recorded for a cache.
+
+    Args:
+        missing_value (int): Raw value masked with NaN while reading. (default: None)
+        scale_factor (float): Factor the data is scaled with while reading. (default: 1)
+        decode_dtype (str,numpy.dtype): Datatype of masked or scaled data.
+            (default: float64)
+        native_endian (bool): Whether the data is converted into native byte order.
+            (default: True)
+    """
+    decoded = missing_value is not None or scale_factor != 1
+    return {
+        "missing_value": missing_value,
+        "scale_factor": scale_factor,
+        "decode_dtype": np.dtype(decode_dtype or "float64").str if decoded else None,
+        "native_endian": native_endian,
+    }
+
+
+def _uniform_chunks(data):
+    """Returns one chunk size per dimension, as Zarr can't store irregular chunks.
+
+    Note:
+        Chunks that are uniform except for a smaller last one, e.g. one per tile, are
+        kept, otherwise the largest chunk is used.
+    """
+    return {
+        dim: (
+            chunks[0]
+            if len(set(chunks[:-1])) <= 1 and chunks[-1] <= chunks[0]
+            else max(chunks)
+        )
+        for dim, chunks in zip(data.dims, data.chunks)
+    }
+
+
+def to_cache(ds, path, var):
+    """Writes a variable into a chunked Zarr or NetCDF cache, see `WPSAccessor.to_cache`.
+
+    Note:
+        Unchunked data is chunked like the tiles. The attributes are stored as JSON in
+        a global attribute, so CF decoding doesn't apply `missing_value` or
+        `scale_factor` to the already decoded data a second time.
+
+    Args:
+        ds (xarray.Dataset): WPS dataset.
+        path (str,pathlib.Path): Zarr store, or NetCDF file if it ends with ".nc".
+        var (str): Name of variable to cache.
+
+    Returns:
+        registered (bool): Whether the cache was registered with the dataset.
+    """
+    path = Path(path).absolute()
+    data = ds[var]
+    index = {
+        **data.attrs,
+        **{key: value for key, value in ds.attrs.items() if key != "directory"},
+    }
+    if data.chunks is None:
+        data = data.chunk(
+            {
+                "x": index.get("tile_x", data.sizes["x"]),
+                "y": index.get("tile_y", data.sizes["y"]),
+            }
+        )
+    data = data.chunk(_uniform_chunks(data))
+    cache = data.to_dataset()
+    cache[var].attrs = {}
+    cache[var].encoding = {}
+    cache.attrs = {INDEX_ATTR: json.dumps(index)}
+    if "directory" in ds.attrs:
+        cache.attrs["directory"] = ds.attrs["directory"]
+
+    if _is_netcdf(path):
+        chunksizes = tuple(chunks[0] for chunks in data.chunks)
+        cache.to_netcdf(path, encoding={var: {"chunksizes": chunksizes}})
+    else:
+        cache.to_zarr(path, mode="w")
+
+    # only data coming straight from all tiles of a dataset may replace it
+    directory = ds.attrs.get("directory")
+    mosaic, decoded = _find_mosaic(ds[var])
+    if directory is None or mosaic is None:
+        return False
+    names = {Path(tile.filename_or_obj).name for tile in mosaic.tiles.values()}
+    fingerprint = _fingerprint(directory)
+    if not set(fingerprint) - {"index"} <= names:
+        return False
+    decoding = {}
+    if decoded is not None:
+        decoding = {
+            "missing_value": decoded.missing_value,
+            "scale_factor": decoded.scale_factor,
+            "decode_dtype": decoded.dtype,
+        }
+    has_manifest = _manifest_path(directory).is_file()
+    with open(_cache_path(directory), "w") as f:
+        json.dump(
+            {
+                "version": CACHE_VERSION,
+                "path": str(path),
+                "var": var,
+                "filename_digits": config.get("index.filename_digits"),
+                "fingerprint": fingerprint,
+                "decoding": _decode_settings(
+                    **decoding, native_endian=mosaic.native_endian
+                ),
+            },
+            f,
+        )
+    if has_manifest:
+        # registering the cache modified the directory of the dataset
+        write_manifest(directory)
+    return True
+
+
+def from_cache(path, chunks=None):
+    """Opens a cache written by `ds.wps.to_cache` and populates config.
+
+    Like `open_dataset`, the index of the cached dataset is put into the
+    wps_xr.config object, so the Dataset can be written with `ds.wps.to_disk`, which
+    streams it chunk by chunk into the tiles.
+
+    Args:
+        path (str,pathlib.Path): Zarr store or NetCDF file of the cache.
+        chunks (int or dict): Chunk sizes, see `open_dataset`. (default: as stored)
+
+    Returns:
+        ds (xarray.Dataset): The cached dataset, with the attributes of the original.
+
+    Raises:
+        ValueError: If `path` wasn't written by `to_cache`.
+    """
+    path = Path(path)
+    engine = None if _is_netcdf(path) else "zarr"
+    ds = xr.open_dataset(path, engine=engine, chunks={})
+    if INDEX_ATTR not in ds.attrs:
+        raise ValueError(f"{path} is not a cache written by `to_cache`.")
+    index = json.loads(ds.attrs.pop(INDEX_ATTR))
+    config.update(dict(index=index), priority="new")
+
+    global_attrs = config.get("general.GLOBAL_ATTRS")
+    for var in ds.data_vars.values():
+        var.attrs = {
+            key: value for key, value in index.items() if key not in global_attrs
+        }
+        var.encoding["preferred_chunks"] = dict(zip(var.dims, var.chunks))
+    ds.attrs.update({key: value for key, value in index.items() if key in global_attrs})
+    if chunks is None:
+        return ds
+    return _chunk_mosaic(ds, chunks)
+
+
+def _read_registered(pathname_or_obj):
+    try:
+        with open(_cache_path(pathname_or_obj)) as f:
+            registered = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if registered.get("version") != CACHE_VERSION:
+        return None
+    return registered
+
+
+def _open_fresh_cache(pathname_or_obj, chunks=None):
+    """Opens the cache registered with a dataset, if it is still fresh.
+
+    Note:
+        The cache is fresh if no tile was added or removed, and the `index` and every
+        tile still have the size and mtime they had when the cache was written. This
+        costs a listing of the directory and one stat per tile. The tiles must also
+        still be decoded like the cached data, see `backend.decode_policy`,
+        `backend.decode_dtype` and `backend.native_endian`.
+
+    Returns:
+        ds (xarray.Dataset or None): The cached dataset, named like `open_dataset`
+            names it, or None if there is no fresh cache.
+    """
+    registered = _read_registered(pathname_or_obj)
+    if registered is None or not Path(registered["path"]).exists():
+        return None
+    # the index isn't read yet, the tiles are found with the digits they had
+    digits = registered["filename_digits"]
+    try:
+        with config.set({"index.filename_digits": digits}):
+            fresh = _fingerprint(pathname_or_obj) == registered["fingerprint"]
+    except OSError:
+        return None
+    if not fresh:
+        return None
+    _construct_index(pathname_or_obj)
+    decoding = _decode_settings(
+        **_generate_decoding_from_config(),
+        native_endian=config.get("backend.native_endian"),
+    )
+    if decoding != registered["decoding"]:
+        return None
+    ds = from_cache(registered["path"], chunks)
+    return ds.rename({registered["var"]: Path(pathname_or_obj).name})
@@ -0,0 +1,193 @@
+"""Block-wise kernels for categorical data, e.g. landuse or soil types."""
+
+import dask.array
+import numpy as np
+import xarray as xr
+
+from .mosaic import _cell_aligned_chunks
+
+
+def _category_range(da):
+    """Returns the first category and the number of categories of a DataArray.
+
+    Raises:
+        ValueError: If the data is not categorical.
+    """
+    if da.attrs.get("type") != "categorical":
+        raise ValueError("Data is not categorical.")
+    cmin, cmax = da.attrs["category_min"], da.attrs["category_max"]
+    return cmin, cmax - cmin + 1
+
+
+def _valid_categories(block, cmin, ncat, mask=None):
+    """Returns the category offsets of a block and where they are valid.
+
+    Note:
+        Missing values (NaN or a sentinel outside of the category range) are invalid.
+    """
+    valid = (block >= cmin) & (block < cmin + ncat)
+    if mask is not None:
+        valid &= mask
+    cats = np.where(valid, block, cmin).astype(np.intp) - cmin
+    return cats, valid
+
+
+def _category_counts(block, factor, cmin, ncat):
+    """Counts the categories of every coarse cell within a block.
+
+    Args:
+        block (numpy.ndarray): Categories in (y, x) order, a multiple of `factor`.
+        factor (tuple of int): Number of cells in x, y direction per coarse cell.
+        cmin (int): First category.
+        ncat (int): Number of categories.
+
+    Returns:
+        counts (numpy.ndarray): Counts in (y, x, category) order.
+    """
+    ny, nx = block.shape[0] // factor[1], block.shape[1] // factor[0]
+    cats, valid = _valid_categories(block, cmin, ncat)
+    cells = (np.arange(ny).repeat(factor[1])[:, None] * nx) + np.arange(nx).repeat(
+        factor[0]
+    )[None, :]
+    return np.bincount((cells * ncat + cats)[valid], minlength=ny * nx * ncat).reshape(
+        ny, nx, ncat
+    )
+
+
+def _fractions_kernel(block, factor, cmin, ncat):
+    """Computes the category fractions of every coarse cell, NaN if none is valid."""
+    counts = _category_counts(block, factor, cmin, ncat)
+    total = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, counts / total, np.nan)
+
+
+def _mode_kernel(block, factor, cmin, ncat, fill_value):
+    """Computes the most frequent category of every coarse cell.
+
+    Note:
+        Ties are resolved towards the lowest category. Coarse cells without any valid
+        category are set to `fill_value`.
+    """
+    counts = _category_counts(block, factor, cmin, ncat)
+    mode = np.argmax(counts, axis=-1) + cmin
+    return np.where(counts.any(axis=-1), mode, fill_value).astype(block.dtype)
+
+
+def _histogram_kernel(block, mask=None, *, cmin, ncat):
+    """Counts the categories of a block, returned in shape (1, 1, ncat)."""
+    cats, valid = _valid_categories(block, cmin, ncat, mask)
+    return np.bincount(cats[valid], minlength=ncat).reshape(1, 1, ncat)
+
+
+def _trim_to_cells(da, factor):
+    """Drops the cells at the edge that don't fill a whole coarse cell.
+
+    Returns:
+        da (xarray.DataArray): The trimmed data.
+        data (dask.array.Array): Its data, chunked to hold whole coarse cells.
+    """
+    da = da.isel(
+        y=slice(0, da.sizes["y"] // factor[1] * factor[1]),
+        x=slice(0, da.sizes["x"] // factor[0] * factor[0]),
+    )
+    data = dask.array.asarray(da.data)
+    axes = {da.dims.index("y"): factor[1], da.dims.index("x"): factor[0]}
+    data = data.rechunk(
+        {axis: _cell_aligned_chunks(data.chunks[axis], f) for axis, f in axes.items()}
+    )
+    return da, data
+
+
+def _coarsen_coords(da, factor):
+    """Averages the coordinates along x and y over every coarse cell."""
+    return {
+        name: coord.coarsen(
+            {dim: factor[0] if dim == "x" else factor[1] for dim in coord.dims}
+        ).mean()
+        for name, coord in da.coords.items()
+        if set(coord.dims) <= {"x", "y"} and coord.dims
+    }
+
+
+def category_fractions(da, factor):
+    """Computes the fraction of every category within coarse cells of `factor` cells.
+
+    Note:
+        Every block is reduced with a single `numpy.bincount`. Fractions are relative
+        to the valid cells of a coarse cell. Cells at the edge that don't fill a whole
+        coarse cell are dropped.
+
+    Args:
+        da (xarray.DataArray): Categorical data with dims (y, x).
+        factor (int or tuple of int): Number of cells in x, y direction per coarse cell.
+
+    Returns:
+        fractions (xarray.DataArray): Fractions with dims (y, x, category).
+    """
+    cmin, ncat = _category_range(da)
+    factor = (factor, factor) if np.ndim(factor) == 0 else tuple(factor)
+    da, data = _trim_to_cells(da.transpose("y", "x"), factor)
+    fractions = data.map_blocks(
+        _fractions_kernel,
+        factor,
+        cmin,
+        ncat,
+        chunks=(
+            tuple(c // factor[1] for c in data.chunks[0]),
+            tuple(c // factor[0] for c in data.chunks[1]),
+            (ncat,),
+        ),
+        new_axis=2,
+        dtype="float64",
+    )
+    coords = _coarsen_coords(da, factor)
+    coords["category"] = np.arange(cmin, cmin + ncat)
+    return xr.DataArray(
+        fractions, dims=("y", "x", "category"), coords=coords, attrs=da.attrs
+    )
+
+
+def category_histogram(da, region=None):
+    """Counts the cells of every category, optionally within a region.
+
+    Note:
+        Every block is counted with a single `numpy.bincount`, then the counts of all
+        blocks are summed.
+
+    Args:
+        da (xarray.DataArray): Categorical data with dims (y, x).
+        region (dict or xarray.DataArray): Either a selection passed to `sel`, e.g.
+            `{"lat": slice(40, 50)}`, or a boolean mask. (default: all cells)
+
+    Returns:
+        counts (xarray.DataArray): Number of cells with dim category.
+    """
+    cmin, ncat = _category_range(da)
+    if isinstance(region, dict):
+        da = da.sel(region)
+    da = da.transpose("y", "x")
+    data = dask.array.asarray(da.data)
+    blocks = [data]
+    if isinstance(region, xr.DataArray):
+        mask = region.broadcast_like(da).transpose("y", "x").fillna(False)
+        blocks.append(dask.array.asarray(mask.data.astype(bool)).rechunk(data.chunks))
+    counts = dask.array.map_blocks(
+        _histogram_kernel,
+        *blocks,
+        cmin=cmin,
+        ncat=ncat,
+        chunks=(
+            (1,) * len(data.chunks[0]),
+            (1,) * len(data.chunks[1]),
+            (ncat,),
+        ),
+        new_axis=2,
+        dtype="int64",
+    ).sum(axis=(0, 1))
+    return xr.DataArray(
+        counts,
+        dims="category",
+        coords={"category": np.arange(cmin, cmin + ncat)},
+        attrs=da.attrs,
+    )
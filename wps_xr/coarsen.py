@@ -0,0 +1,134 @@
+"""Coarsens WPS datasets tile by tile, e.g. to derive 10m from 30s data."""
+
+import numpy as np
+import xarray as xr
+
+from .categorical import (
+    _category_range,
+    _coarsen_coords,
+    _mode_kernel,
+    _trim_to_cells,
+)
+from .config import config
+
+
+def _mean_kernel(block, factor):
+    """Averages the valid cells of every coarse cell within a block.
+
+    Note:
+        NaNs are ignored. Coarse cells without any valid cell are NaN.
+
+    Args:
+        block (numpy.ndarray): Data in (y, x, ...) order, a multiple of `factor`.
+        factor (tuple of int): Number of cells in x, y direction per coarse cell.
+    """
+    ny, nx = block.shape[0] // factor[1], block.shape[1] // factor[0]
+    shape = (ny, factor[1], nx, factor[0]) + block.shape[2:]
+    dtype = np.result_type(block.dtype, np.float32)
+    valid = ~np.isnan(block) if block.dtype.kind == "f" else np.ones(block.shape, bool)
+    sums = np.where(valid, block, 0).reshape(shape).sum(axis=(1, 3), dtype=dtype)
+    counts = valid.reshape(shape).sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan).astype(dtype)
+
+
+def _coarse_index(index, factor):
+    """Numbers the coarse cells, continuing the numbering of the tiles."""
+    start = (int(index[0]) - 1) // factor + 1
+    return np.arange(start, start + index.size // factor)
+
+
+def _coarsen_array(da, factor, method=None):
+    """Coarsens a DataArray by `factor` cells per direction, one chunk at a time.
+
+    Args:
+        da (xarray.DataArray): Data with dims (y, x, ...).
+        factor (tuple of int): Number of cells in x, y direction per coarse cell.
+        method (str): "mode" or "mean". (default: by the type of the data)
+
+    Returns:
+        da (xarray.DataArray): The coarse data, with renumbered x/y and averaged
+            lat/lon coords.
+    """
+    if method is None:
+        method = "mode" if da.attrs.get("type") == "categorical" else "mean"
+
+    da, data = _trim_to_cells(da.transpose("y", "x", ...), factor)
+    chunks = (
+        tuple(c // factor[1] for c in data.chunks[0]),
+        tuple(c // factor[0] for c in data.chunks[1]),
+    ) + data.chunks[2:]
+    if method == "mode":
+        cmin, ncat = _category_range(da)
+        fill_value = (
+            np.nan if da.dtype.kind == "f" else da.attrs.get("missing_value", 0)
+        )
+        coarse = data.map_blocks(
+            _mode_kernel, factor, cmin, ncat, fill_value, chunks=chunks, dtype=da.dtype
+        )
+    elif method == "mean":
+        coarse = data.map_blocks(
+            _mean_kernel,
+            factor,
+            chunks=chunks,
+            dtype=np.result_type(da.dtype, np.float32),
+        )
+    else:
+        raise ValueError(f"Unknown coarsening method {method}.")
+
+    coords = _coarsen_coords(da.drop_vars(["x", "y"]), factor)
+    coords.update(
+        {
+            "x": _coarse_index(da.x.values, factor[0]),
+            "y": _coarse_index(da.y.values, factor[1]),
+        }
+    )
+    if "z" in da.coords:
+        coords["z"] = da.z
+    return xr.DataArray(coarse, dims=da.dims, coords=coords, attrs=da.attrs)
+
+
+def coarsen(ds, factor, method=None, var=None):
+    """Coarsens a variable by `factor` cells per direction, one chunk at a time.
+
+    Note:
+        Tile-aligned chunks are kept if the tile size is a multiple of `factor`, so
+        every tile is reduced on its own, in parallel and out-of-core. Cells at the
+        edge that don't fill a whole coarse cell are dropped. Like `open_dataset`,
+        this populates the `index` of the wps_xr.config object with the coarse grid,
+        so the result can be written with `to_disk` right away.
+
+    Args:
+        ds (xarray.Dataset): WPS dataset, e.g. from `open_dataset`.
+        factor (int or tuple of int): Number of cells in x, y direction per coarse cell.
+        method (str): "mode" (majority) or "mean", ignoring missing values.
+            (default: "mode" for categorical, "mean" for continuous data)
+        var (str): Name of variable to coarsen.
+
+    Returns:
+        ds (xarray.Dataset): The coarse variable with lat/lon coords, with tiles of
+            the original tile size divided by `factor`.
+
+    Raises:
+        ValueError: If `method` is unknown, or "mode" is used on continuous data.
+    """
+    factor = (factor, factor) if np.ndim(factor) == 0 else tuple(factor)
+    coarse = _coarsen_array(ds[var], factor, method)
+
+    grid = {
+        "dx": ds.attrs["dx"] * factor[0],
+        "dy": ds.attrs["dy"] * factor[1],
+        "known_x": 1.0,
+        "known_y": 1.0,
+        "known_lon": float(
+            coarse.lon[0] - (coarse.x[0] - 1) * ds.attrs["dx"] * factor[0]
+        ),
+        "known_lat": float(
+            coarse.lat[0] - (coarse.y[0] - 1) * ds.attrs["dy"] * factor[1]
+        ),
+    }
+    tiles = {"tile_x": coarse.chunks[1][0], "tile_y": coarse.chunks[0][0]}
+    config.update({"index": {**grid, **tiles}}, priority="new")
+
+    coarse.attrs = {**coarse.attrs, **tiles}
+    return xr.Dataset({var: coarse}, attrs={**ds.attrs, **grid})
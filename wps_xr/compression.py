@@ -0,0 +1,185 @@
+"""Reads and writes tiles compressed with a codec of the standard library."""
+
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .config import config
+from .utils import CODECS, _split_codec
+
+
+def _compress(data, codec):
+    """Compresses bytes with `compression.level` or the default level of the codec."""
+    _, compress, _, level_keyword = CODECS[codec]
+    level = config.get("compression.level")
+    return compress(data, **({} if level is None else {level_keyword: level}))
+
+
+def _decompress_file(filename):
+    _, codec = _split_codec(filename)
+    with open(filename, "rb") as f:
+        return CODECS[codec][2](f.read())
+
+
+class _TileCache:
+    """Keeps the most recently decompressed tiles, up to `compression.cache_size` bytes.
+
+    Note:
+        Tiles are cached by filename, size and mtime, so rewritten tiles are
+        decompressed again. A tile requested by several threads at once is only
+        decompressed by the first one, while the others wait for it.
+    """
+
+    def __init__(self):
+        self._tiles = OrderedDict()
+        self._nbytes = 0
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """Returns the decompressed bytes of a tile."""
+        stat = os.stat(filename)
+        key = (str(filename), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+            loading = self._loading.get(key)
+            if loading is None:
+                self._loading[key] = threading.Event()
+        if loading is not None:
+            loading.wait()
+            return self.get(filename)
+
+        try:
+            data = _decompress_file(filename)
+            with self._lock:
+                self._add(key, data)
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+        return data
+
+    def _add(self, key, data):
+        cache_size = config.get("compression.cache_size")
+        if len(data) > cache_size:
+            return
+        self._tiles[key] = data
+        self._nbytes += len(data)
+        while self._nbytes > cache_size:
+            _, evicted = self._tiles.popitem(last=False)
+            self._nbytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._nbytes = 0
+
+
+_tile_cache = _TileCache()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _decompression_pool():
+    """Returns the thread pool decompressing tiles, started on first use.
+
+    Note:
+        All codecs release the GIL while decompressing, so the threads run in parallel.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(config.get("compression.num_workers"))
+    return _pool
+
+
+def _read_compressed(filename, dtype, shape):
+    """Returns a compressed tile as read-only array, decompressed or from the cache."""
+    return np.frombuffer(_tile_cache.get(filename), dtype).reshape(shape)
+
+
+def _prefetch(filenames):
+    """Decompresses several tiles into the cache in parallel."""
+    filenames = list(filenames)
+    if len(filenames) > 1:
+        list(_decompression_pool().map(_tile_cache.get, filenames))
+
+
+def _export_tile(tile, dirname, tile_bdr):
+    """Writes one tile of a mosaic uncompressed into `dirname`.
+
+    Note:
+        Absent tiles are written with their constant value, halo included.
+    """
+    filename = Path(tile.filename_or_obj)
+    name, codec = _split_codec(filename)
+    if not filename.exists():
+        shape = [
+            size + 2 * tile_bdr if axis < 2 else size
+            for axis, size in enumerate(tile.shape)
+        ]
+        np.full(shape, tile.value, tile.dtype).tofile(dirname / name)
+    elif codec is not None:
+        (dirname / name).write_bytes(_decompress_file(filename))
+    else:
+        shutil.copyfile(filename, dirname / name)
+
+
+def decompress_dataset(pathname_or_obj, dirname_or_obj, force=False):
+    """Writes an uncompressed copy of a WPS dataset, e.g. for geogrid.
+
+    Note:
+        The tiles are decompressed in parallel, with `compression.num_workers` threads.
+        Uncompressed tiles are copied, and absent tiles (see `to_disk`) are written
+        with `index.missing_value`, so the copy holds every tile of the grid.
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Directory of the dataset.
+        dirname_or_obj (str,pathlib.Path): Directory to write the copy to.
+        force (bool): Whether to override an existing directory. (default: False)
+    """
+    # imported here, as the reader imports this module to decompress tiles
+    from .manifest import write_manifest
+    from .mosaic import _find_mosaic
+    from .stats import _read_stats, _unchanged, write_stats
+    from .wps import open_dataset
+    from .wps_accessor import _prepare_wps_directory
+
+    pathname_or_obj, dirname_or_obj = Path(pathname_or_obj), Path(dirname_or_obj)
+    # the tiles are exported, even if a cache of the dataset is registered
+    with config.set({"cache.use": False}):
+        ds = open_dataset(pathname_or_obj)
+    mosaic, _ = _find_mosaic(ds[list(ds.data_vars)[0]])
+    tile_bdr = mosaic.tile_bdr
+
+    _prepare_wps_directory(dirname_or_obj, force)
+    shutil.copyfile(pathname_or_obj / "index", dirname_or_obj / "index")
+    with ThreadPoolExecutor(config.get("compression.num_workers")) as pool:
+        list(
+            pool.map(
+                lambda tile: _export_tile(tile, dirname_or_obj, tile_bdr),
+                mosaic.tiles.values(),
+            )
+        )
+
+    tile_stats = _read_stats(pathname_or_obj)
+    if tile_stats is not None:
+        write_stats(
+            dirname_or_obj,
+            {
+                _split_codec(name)[0]: {
+                    key: value
+                    for key, value in stats.items()
+                    if key not in ["size", "mtime_ns"]
+                }
+                for name, stats in tile_stats.items()
+                if _unchanged(pathname_or_obj, name, stats)
+            },
+        )
+    write_manifest(dirname_or_obj, absent=[])
@@ -117,7 +117,7 @@ def _write_index(pathname_or_obj):
         for key, val in config.get("index").items():
             if (
                 key in config.get("index_defaults")
-                and val != config.get("index_defaults")[key]
+                and val == config.get("index_defaults")[key]
             ):
                 continue
             if key in ["units", "description", "mminlu"]:
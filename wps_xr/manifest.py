@@ -0,0 +1,175 @@
+"""Reads and writes the tile manifest, a sidecar file listing all tiles of a dataset."""
+
+import json
+import os
+from pathlib import Path
+
+from loguru import logger
+
+from .config import config
+from .utils import CODECS, wps_static_filename_to_idx
+
+MANIFEST_VERSION = 1
+
+
+def _manifest_path(pathname_or_obj):
+    return Path(pathname_or_obj) / config.get("manifest.filename")
+
+
+def _tile_pattern():
+    index_str = "?" * config.get("index.filename_digits")
+    return f"{index_str}-{index_str}.{index_str}-{index_str}"
+
+
+def _tile_files(pathname_or_obj):
+    """Lists the tiles of a WPS dataset, uncompressed or compressed with any codec."""
+    pattern = _tile_pattern()
+    return [
+        fn
+        for suffix in [""] + [suffix for suffix, *_ in CODECS.values()]
+        for fn in Path(pathname_or_obj).glob(pattern + suffix)
+    ]
+
+
+def _absent_tiles(pathname_or_obj):
+    """Returns the names of the tiles the manifest records as absent and still are.
+
+    Note:
+        The manifest is not checked for staleness here, see `_read_manifest`, so the
+        absent tiles still complete the tile grid after the directory was modified.
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Directory of the dataset.
+    """
+    try:
+        with open(_manifest_path(pathname_or_obj)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if manifest.get("version") != MANIFEST_VERSION:
+        return []
+    pathname_or_obj = Path(pathname_or_obj)
+    return [
+        tile["name"]
+        for tile in manifest.get("absent", [])
+        if not (pathname_or_obj / tile["name"]).exists()
+    ]
+
+
+def write_manifest(pathname_or_obj, absent=None):
+    """Writes the tile manifest of a WPS dataset next to its `index` file.
+
+    The manifest records name, extents, byte size and mtime of every tile, so later
+    calls to `open_dataset` don't need to list the directory.
+
+    Note:
+        The tiles are found with the current `index.filename_digits` from config.
+        Absent tiles, which hold `index.missing_value` everywhere and were not written
+        (see `to_disk(skip_empty_tiles=True)`), are recorded with their extents, so
+        the reader knows the full tile grid even if a whole row of tiles is absent.
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Directory of the dataset.
+        absent (iterable of str): Names of the absent tiles. (default: the absent tiles
+            of the previous manifest that still don't exist)
+    """
+    pathname_or_obj = Path(pathname_or_obj)
+    if absent is None:
+        absent = _absent_tiles(pathname_or_obj)
+    absent = sorted(name for name in absent if not (pathname_or_obj / name).exists())
+    tiles = []
+    for fn in sorted(_tile_files(pathname_or_obj)):
+        (xstart, xend), (ystart, yend) = wps_static_filename_to_idx(fn)
+        stat = fn.stat()
+        tiles.append(
+            {
+                "name": fn.name,
+                "x": [int(xstart), int(xend)],
+                "y": [int(ystart), int(yend)],
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+        )
+    # the file is written in place, as renaming it would modify the directory after
+    # the manifest and mark it stale right away
+    with open(_manifest_path(pathname_or_obj), "w") as f:
+        json.dump(
+            {
+                "version": MANIFEST_VERSION,
+                "tiles": tiles,
+                "absent": [_absent_entry(name) for name in absent],
+            },
+            f,
+        )
+
+
+def _absent_entry(name):
+    (xstart, xend), (ystart, yend) = wps_static_filename_to_idx(name)
+    return {"name": name, "x": [int(xstart), int(xend)], "y": [int(ystart), int(yend)]}
+
+
+def _read_manifest(pathname_or_obj):
+    """Reads the tile manifest of a WPS dataset if it is still valid.
+
+    Note:
+        Adding or removing tiles changes the mtime of the directory, so the manifest
+        is stale if the directory was modified after it. With `manifest.check_tiles`,
+        the size and mtime of every tile is compared as well.
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Directory of the dataset.
+
+    Returns:
+        extents (dict or None): Maps tile filenames to their (x, y) index ranges, or
+            None if there is no valid manifest. Absent tiles are included, see
+            `_absent_tiles`.
+    """
+    pathname_or_obj = Path(pathname_or_obj)
+    fn = _manifest_path(pathname_or_obj)
+    try:
+        if os.stat(pathname_or_obj).st_mtime_ns > os.stat(fn).st_mtime_ns:
+            logger.info("Tile manifest is stale, listing the directory instead.")
+            return None
+        with open(fn) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+
+    extents = {}
+    for tile in manifest["tiles"]:
+        tile_fn = pathname_or_obj / tile["name"]
+        if config.get("manifest.check_tiles"):
+            try:
+                stat = tile_fn.stat()
+            except OSError:
+                return None
+            if (stat.st_size, stat.st_mtime_ns) != (tile["size"], tile["mtime_ns"]):
+                logger.info("Tile manifest is stale, listing the directory instead.")
+                return None
+        extents[tile_fn] = (tuple(tile["x"]), tuple(tile["y"]))
+    for tile in manifest.get("absent", []):
+        extents[pathname_or_obj / tile["name"]] = (tuple(tile["x"]), tuple(tile["y"]))
+    return extents
+
+
+def _find_tiles(pathname_or_obj):
+    """Returns the tiles of a WPS dataset from its manifest, or by listing the directory.
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Directory of the dataset.
+
+    Returns:
+        tiles (dict or list): The tile extents from the manifest (see `_read_manifest`),
+            or the list of tile filenames if there is no valid manifest. The list
+            includes the absent tiles still recorded by a stale manifest, as they
+            complete the tile grid.
+    """
+    if not config.get("manifest.use"):
+        return _tile_files(pathname_or_obj)
+    extents = _read_manifest(pathname_or_obj)
+    if extents is not None:
+        return extents
+    absent = [Path(pathname_or_obj) / name for name in _absent_tiles(pathname_or_obj)]
+    return _tile_files(pathname_or_obj) + absent
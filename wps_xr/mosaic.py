@@ -0,0 +1,568 @@
+"""Assembles all tiles of a WPS dataset into one lazily indexed mosaic array."""
+
+from pathlib import Path
+
+import dask
+import dask.array as da
+import numpy as np
+import xarray as xr
+
+from .backend import generate_shape_and_coordinate_indices
+from .backend_array import (
+    _INDEXING_SUPPORT,
+    BinaryBackendArray,
+    ConstantBackendArray,
+    DecodedBackendArray,
+    _decode,
+    _outer_indexing,
+    _to_native,
+)
+from .compression import _prefetch
+from .config import config
+from .utils import _tile_filename, wps_static_filename_to_idx
+
+# private encoding of variables read straight from a mosaic, see `_find_mosaic`
+MOSAIC_ENCODING = "_wps_mosaic"
+
+
+def _tile_grid(filenames, fill_holes=False):
+    """Builds the global tile grid from tile filenames.
+
+    Note:
+        Only the filenames are parsed, no tile is opened.
+
+    Args:
+        filenames (iterable of str,pathlib.Path or dict): Tile files of the dataset, or
+            a dict mapping them to their (x, y) index ranges, e.g. from the manifest.
+        fill_holes (bool): Whether to fill holes in the grid with the names of the
+            absent tiles, in the directory of the others. (default: False)
+
+    Returns:
+        x_ranges (list of tuple): Sorted (start, end) index ranges of the tile columns.
+        y_ranges (list of tuple): Sorted (start, end) index ranges of the tile rows.
+        tiles (dict): Maps (row, column) of the tile grid to the tile filename.
+
+    Raises:
+        ValueError: If the tiles overlap or, unless `fill_holes`, don't cover a
+            rectangular domain.
+    """
+    if isinstance(filenames, dict):
+        extents = dict(filenames)
+    else:
+        extents = {}
+        for fn in filenames:
+            (xstart, xend), (ystart, yend) = wps_static_filename_to_idx(fn)
+            extents[fn] = ((int(xstart), int(xend)), (int(ystart), int(yend)))
+    if not extents:
+        raise ValueError("No tiles found.")
+
+    x_ranges = sorted({ext[0] for ext in extents.values()})
+    y_ranges = sorted({ext[1] for ext in extents.values()})
+    for ranges in (x_ranges, y_ranges):
+        for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+            if start != end + 1:
+                raise ValueError("Tiles don't form a contiguous, non-overlapping grid.")
+
+    tiles = {
+        (y_ranges.index(ext[1]), x_ranges.index(ext[0])): fn
+        for fn, ext in extents.items()
+    }
+    if len(tiles) != len(x_ranges) * len(y_ranges):
+        if not fill_holes:
+            raise ValueError("Tile grid is incomplete.")
+        dirname = Path(next(iter(extents))).parent
+        for row, (ystart, yend) in enumerate(y_ranges):
+            for col, (xstart, xend) in enumerate(x_ranges):
+                if (row, col) not in tiles:
+                    tiles[(row, col)] = dirname / _tile_filename(
+                        xstart, xend, ystart, yend
+                    )
+    return x_ranges, y_ranges, tiles
+
+
+def _select_tiles(filenames, x_range, y_range):
+    """Selects the tiles intersecting (start, end) index ranges along x and y.
+
+    Note:
+        Only the filenames are parsed, no tile is opened.
+
+    Args:
+        filenames (iterable of str,pathlib.Path or dict): Tile files of the dataset,
+            optionally mapped to their (x, y) index ranges.
+        x_range (tuple of int): Index range along x, both ends inclusive.
+        y_range (tuple of int): Index range along y, both ends inclusive.
+
+    Returns:
+        extents (dict): Maps the selected tiles to their (x, y) index ranges.
+    """
+    if not isinstance(filenames, dict):
+        filenames = {
+            fn: tuple(
+                tuple(int(i) for i in idx) for idx in wps_static_filename_to_idx(fn)
+            )
+            for fn in filenames
+        }
+    return {
+        fn: ext
+        for fn, ext in filenames.items()
+        if all(
+            start <= rng[1] and end >= rng[0]
+            for (start, end), rng in zip(ext, [x_range, y_range])
+        )
+    }
+
+
+def _as_key(local, like):
+    """Turns the positions requested from one tile back into a key of the given kind.
+
+    Note:
+        Positions requested with a slice are an arithmetic progression, so they are
+        passed on as a slice, which keeps reads views and works with BASIC indexing.
+
+    Args:
+        local (numpy.ndarray): Requested positions along one tile axis.
+        like (int,slice,numpy.ndarray): Original key along the mosaic axis.
+    """
+    if isinstance(like, np.ndarray):
+        return local
+    if len(local) == 1:
+        return slice(local[0], local[0] + 1)
+    step = local[1] - local[0]
+    stop = local[-1] + np.sign(step)
+    return slice(local[0], stop if stop >= 0 else None, step)
+
+
+class MosaicBackendArray(xr.backends.BackendArray):
+    """Lazily indexed array covering every tile of a WPS dataset.
+
+    Each read is dispatched to the `BinaryBackendArray` of the tiles it intersects,
+    so a read that is aligned with a tile costs exactly one tile read. With
+    `backend.native_endian`, the data is converted into native byte order once while
+    reading, as later arithmetic on non-native data is much slower.
+
+    Args:
+        x_ranges (list of tuple): (start, end) index ranges of the tile columns.
+        y_ranges (list of tuple): (start, end) index ranges of the tile rows.
+        tiles (dict): Maps (row, column) of the tile grid to the tile filename.
+        dtype (str,numpy.dtype): Datatype of the tiles.
+        constants (dict): Maps names of tiles known to hold a single value everywhere
+            to that value. These tiles are never read. (default: None)
+    """
+
+    def __init__(self, x_ranges, y_ranges, tiles, dtype, constants=None):
+        self.x_edges = np.cumsum([0] + [end - start + 1 for start, end in x_ranges])
+        self.y_edges = np.cumsum([0] + [end - start + 1 for start, end in y_ranges])
+        self.native_endian = config.get("backend.native_endian")
+        # the tiles are read with the layout of the dataset when it was opened
+        self.tile_bdr = config.get("index.tile_bdr")
+        row_order = config.get("index.row_order")
+        lock = config.get("backend.lock")
+        self.dtype = np.dtype(dtype)
+        if self.native_endian:
+            self.dtype = self.dtype.newbyteorder("=")
+        constants = constants or {}
+        self.tiles = {}
+        for (row, col), fn in tiles.items():
+            shape, _ = generate_shape_and_coordinate_indices(fn)
+            if Path(fn).name in constants:
+                self.tiles[(row, col)] = ConstantBackendArray(
+                    fn, shape, dtype, constants[Path(fn).name]
+                )
+            else:
+                self.tiles[(row, col)] = BinaryBackendArray(
+                    filename_or_obj=fn,
+                    shape=shape,
+                    dtype=dtype,
+                    lock=dask.utils.SerializableLock() if lock else None,
+                    tile_bdr=self.tile_bdr,
+                    row_order=row_order,
+                )
+        self.shape = (self.y_edges[-1], self.x_edges[-1]) + tuple(shape[2:])
+
+    def __getitem__(self, key: tuple):
+        return xr.core.indexing.explicit_indexing_adapter(
+            key,
+            self.shape,
+            _INDEXING_SUPPORT[config.get("backend.read_mode")],
+            self._raw_indexing_method,
+        )
+
+    def _raw_indexing_method(self, key: tuple):
+        key = tuple(key) + (slice(None),) * (len(self.shape) - len(key))
+        idx = [np.arange(n)[k] for n, k in zip(self.shape[:2], key[:2])]
+        # tile row/column of every requested position
+        pos = [
+            np.searchsorted(edges, np.atleast_1d(i), side="right") - 1
+            for edges, i in zip((self.y_edges, self.x_edges), idx)
+        ]
+        rows, cols = np.unique(pos[0]), np.unique(pos[1])
+        # compressed tiles spanned by the read are decompressed in parallel
+        _prefetch(
+            self.tiles[(row, col)].filename_or_obj
+            for row in rows
+            for col in cols
+            if getattr(self.tiles[(row, col)], "codec", None) is not None
+        )
+        if len(rows) != 1 or len(cols) != 1:
+            zshape = _outer_indexing(np.empty(self.shape[2:], bool), key[2:]).shape
+            out = np.empty((pos[0].size, pos[1].size) + zshape, self.dtype)
+
+        for row in rows:
+            ysel = np.flatnonzero(pos[0] == row)
+            ykey = _as_key(np.atleast_1d(idx[0])[ysel] - self.y_edges[row], key[0])
+            for col in cols:
+                xsel = np.flatnonzero(pos[1] == col)
+                xkey = _as_key(np.atleast_1d(idx[1])[xsel] - self.x_edges[col], key[1])
+                block = self.tiles[(row, col)]._raw_indexing_method(
+                    (ykey, xkey) + key[2:]
+                )
+                if len(rows) == 1 and len(cols) == 1:
+                    # the read is covered by a single tile, pass the view through
+                    out = _to_native(block) if self.native_endian else block
+                else:
+                    # the byte order is converted while copying
+                    out[np.ix_(ysel, xsel)] = block
+        # drop axes that were indexed with an integer
+        return out[tuple(0 if np.ndim(i) == 0 else slice(None) for i in idx)]
+
+
+def _sample_mosaic(mosaic, decoded, y, x):
+    """Reads the cells at pairs of (y, x) positions, with one batched read per tile.
+
+    Args:
+        mosaic (MosaicBackendArray): The mosaic to read from.
+        decoded (DecodedBackendArray or None): The decoding applied to the mosaic.
+        y (numpy.ndarray): Row of every point within the mosaic.
+        x (numpy.ndarray): Column of every point within the mosaic.
+
+    Returns:
+        values (numpy.ndarray): Values of the points, with all z-levels.
+    """
+    rows = np.searchsorted(mosaic.y_edges, y, side="right") - 1
+    cols = np.searchsorted(mosaic.x_edges, x, side="right") - 1
+    tile_ids, inverse = np.unique(
+        rows * len(mosaic.x_edges) + cols, return_inverse=True
+    )
+    out = np.empty((len(y),) + tuple(mosaic.shape[2:]), mosaic.dtype)
+    for i, tile_id in enumerate(tile_ids):
+        row, col = divmod(int(tile_id), len(mosaic.x_edges))
+        sel = np.flatnonzero(inverse == i)
+        # the byte order is converted while copying
+        out[sel] = mosaic.tiles[(row, col)]._read_points(
+            y[sel] - mosaic.y_edges[row], x[sel] - mosaic.x_edges[col]
+        )
+    if decoded is not None:
+        out = _decode(out, decoded.missing_value, decoded.scale_factor, decoded.dtype)
+    return out
+
+
+def _find_mosaic(var):
+    """Finds the mosaic an unmodified variable was opened from.
+
+    Note:
+        `_mosaic_dataset` tags its variables with the mosaic in their encoding, and
+        `_chunk_mosaic` records the name of the dask array it chunked them into.
+        Operations keeping the encoding, like `isel` or `copy(data=...)`, still
+        create a dask array with a new name, so only data chunked by `_chunk_mosaic`
+        and not modified since is traced back to its tiles.
+
+    Args:
+        var (xarray.DataArray or xarray.Variable): Variable opened with `_open_mosaic`.
+
+    Returns:
+        mosaic (MosaicBackendArray or None): The mosaic, if it could be found.
+        decoded (DecodedBackendArray or None): The decoding applied to the mosaic.
+    """
+    tag = var.encoding.get(MOSAIC_ENCODING)
+    if tag is None or tag.get("name") is None:
+        return None, None
+    data = var.data
+    if not isinstance(data, da.Array) or data.name != tag["name"]:
+        return None, None
+    return tag["mosaic"], tag["decoded"]
+
+
+def _apply_with_halo(func, tile, depth, decoded, native_endian):
+    arr = tile._tile_view(halo=depth)
+    if decoded is not None:
+        arr = _decode(arr, decoded.missing_value, decoded.scale_factor, decoded.dtype)
+    arr = np.array(arr)
+    out = func(_to_native(arr) if native_endian else arr)
+    return out[depth : out.shape[0] - depth, depth : out.shape[1] - depth, ...]
+
+
+def _map_tile_halos(func, mosaic, depth, decoded=None, dtype=None):
+    """Applies a stencil function to every tile extended by its own on-disk halo.
+
+    Args:
+        func (callable): Function mapping the extended tile to an array of equal shape.
+        mosaic (MosaicBackendArray): Mosaic of the tiles.
+        depth (int): Halo width needed by `func`, at most `mosaic.tile_bdr`.
+        decoded (DecodedBackendArray): Decoding to apply to the tiles. (default: None)
+        dtype (str,numpy.dtype): Datatype returned by `func`. (default: input dtype)
+
+    Returns:
+        data (dask.array.Array): Result with one chunk per tile.
+    """
+    if dtype is None:
+        dtype = (decoded or mosaic).dtype
+    blocks = []
+    for row in range(len(mosaic.y_edges) - 1):
+        blocks.append([])
+        for col in range(len(mosaic.x_edges) - 1):
+            tile = mosaic.tiles[(row, col)]
+            blocks[-1].append(
+                da.from_delayed(
+                    dask.delayed(_apply_with_halo)(
+                        func, tile, depth, decoded, mosaic.native_endian
+                    ),
+                    shape=tuple(tile.shape),
+                    dtype=dtype,
+                )
+            )
+    # concatenated explicitly, as `da.block` would join 3-D tiles along z
+    return da.concatenate([da.concatenate(row, axis=1) for row in blocks], axis=0)
+
+
+def _tile_aligned_chunks(tile_sizes, size=None):
+    """Chunks one axis of the mosaic without splitting reads across tile boundaries.
+
+    Note:
+        Tiles larger than `size` are split into blocks of `size`, smaller adjacent tiles
+        are grouped into chunks of at most `size`, which are read in a single task.
+
+    Args:
+        tile_sizes (tuple of int): Sizes of the tiles along the axis.
+        size (int): Target chunk size, -1 for a single chunk. (default: one per tile)
+
+    Examples:
+        >>> _tile_aligned_chunks((1200, 1200), 500)
+        (500, 500, 200, 500, 500, 200)
+        >>> _tile_aligned_chunks((100, 100, 100), 250)
+        (200, 100)
+    """
+    if size is None:
+        return tuple(tile_sizes)
+    if size == -1:
+        return (sum(tile_sizes),)
+    if size < 1:
+        raise ValueError(f"Invalid chunk size {size}.")
+
+    chunks, grouping = [], False
+    for tile_size in tile_sizes:
+        if tile_size > size:
+            blocks, rest = divmod(tile_size, size)
+            chunks += [size] * blocks + ([rest] if rest else [])
+            grouping = False
+        elif grouping and chunks[-1] + tile_size <= size:
+            chunks[-1] += tile_size
+        else:
+            chunks.append(tile_size)
+            grouping = True
+    return tuple(chunks)
+
+
+def _cell_aligned_chunks(chunks, factor):
+    """Chunks one axis so every chunk holds whole coarse cells of `factor` cells.
+
+    Note:
+        Chunks that all divide evenly by `factor`, e.g. one per tile, are kept, so
+        coarsening still runs tile by tile. Otherwise, the axis is rechunked to the
+        largest multiple of `factor` not exceeding its largest chunk.
+
+    Examples:
+        >>> _cell_aligned_chunks((1200, 1200), 10)
+        (1200, 1200)
+        >>> _cell_aligned_chunks((1200, 1200), 7)
+        1197
+    """
+    if all(chunk % factor == 0 for chunk in chunks):
+        return chunks
+    return max(factor, max(chunks) // factor * factor)
+
+
+def _generate_decoding_from_config():
+    """Generates the decoding options of the data from wps_xr.config object
+
+    Note:
+        With `backend.decode_policy: "compact"`, unscaled categorical data keeps its
+        integer datatype and `missing_value` as sentinel instead of being masked, and
+        continuous data is decoded to float32 if its wordsize fits into the float32
+        mantissa. Otherwise, masked or scaled data is decoded to float64.
+        `backend.decode_dtype` overrides both.
+
+    Returns:
+        decoding (dict): `missing_value`, `scale_factor` and `decode_dtype` to read with
+    """
+    decoding = {
+        "missing_value": config.get("index").get("missing_value"),
+        "scale_factor": config.get("index.scale_factor"),
+        "decode_dtype": config.get("backend.decode_dtype"),
+    }
+    if decoding["decode_dtype"] is not None:
+        return decoding
+    if config.get("backend.decode_policy") == "compact":
+        if config.get("index.type") == "categorical" and decoding["scale_factor"] == 1:
+            decoding["missing_value"] = None
+        elif config.get("index.wordsize") <= 2:
+            decoding["decode_dtype"] = "float32"
+    return decoding
+
+
+def _mosaic_dataset(
+    filenames,
+    dtype,
+    missing_value=None,
+    scale_factor=1,
+    decode_dtype=None,
+    constants=None,
+    fill_value=None,
+):
+    """Opens all tiles as one lazily indexed Dataset without dask.
+
+    Note:
+        The tile grid is built from the filenames alone, so opening scales with the
+        number of tiles instead of aligning one Dataset per tile. The tile sizes are
+        stored as `preferred_chunks` in the encoding of the variable.
+
+    Args:
+        filenames (iterable of str,pathlib.Path or dict): Tile files of the dataset,
+            optionally mapped to their (x, y) index ranges.
+        dtype (str,numpy.dtype): Datatype of the tiles.
+        missing_value (int): Raw value to mask with NaN while reading. (default: None)
+        scale_factor (float): Factor to scale the data with while reading. (default: 1)
+        decode_dtype (str,numpy.dtype): Datatype of masked or scaled data.
+            (default: float64)
+        constants (dict): Maps names of tiles holding a single raw value everywhere
+            to that value, these are never read. (default: None)
+        fill_value (int): Raw value of the absent tiles filling holes in the tile
+            grid, which are never read either. (default: None, holes are an error)
+    """
+    x_ranges, y_ranges, tiles = _tile_grid(filenames, fill_holes=fill_value is not None)
+    constants = dict(constants or {})
+    if fill_value is not None:
+        names = {Path(fn).name for fn in filenames}
+        for fn in tiles.values():
+            if Path(fn).name not in names:
+                constants[Path(fn).name] = fill_value
+    mosaic = MosaicBackendArray(x_ranges, y_ranges, tiles, dtype, constants)
+    _, idx = generate_shape_and_coordinate_indices(tiles[(0, 0)])
+    backend_array, decoded = mosaic, None
+    if missing_value is not None or scale_factor != 1:
+        backend_array = decoded = DecodedBackendArray(
+            mosaic, missing_value, scale_factor, decode_dtype or "float64"
+        )
+
+    dims = ["y", "x"] + (["z"] if len(backend_array.shape) > 2 else [])
+    tile_sizes = {
+        "y": tuple(end - start + 1 for start, end in y_ranges),
+        "x": tuple(end - start + 1 for start, end in x_ranges),
+    }
+    var = xr.Variable(
+        dims,
+        xr.core.indexing.LazilyIndexedArray(backend_array),
+        encoding={
+            "preferred_chunks": tile_sizes,
+            MOSAIC_ENCODING: {"mosaic": mosaic, "decoded": decoded, "name": None},
+        },
+    )
+    coords = {
+        "x": np.arange(x_ranges[0][0], x_ranges[-1][1] + 1),
+        "y": np.arange(y_ranges[0][0], y_ranges[-1][1] + 1),
+    }
+    if "z" in dims:
+        coords["z"] = np.array(idx[2])
+    return xr.Dataset(data_vars={"foo": var}, coords=coords)
+
+
+def _crop_sizes(tile_sizes, start, stop):
+    """Returns the sizes of the tiles along an axis cropped to [start, stop).
+
+    Examples:
+        >>> _crop_sizes((1200, 1200, 1200), 1000, 2500)
+        (200, 1200, 100)
+    """
+    edges = np.cumsum((0,) + tuple(tile_sizes))
+    return tuple(
+        int(min(end, stop) - max(begin, start))
+        for begin, end in zip(edges[:-1], edges[1:])
+        if min(end, stop) > max(begin, start)
+    )
+
+
+def _crop_mosaic(ds, x_range, y_range):
+    """Crops a mosaic Dataset lazily to (start, end) index ranges along x and y.
+
+    Note:
+        The `preferred_chunks` are cropped as well, so chunks stay tile-aligned.
+
+    Args:
+        ds (xarray.Dataset): Dataset opened with `_mosaic_dataset`.
+        x_range (tuple of int): Index range along x, both ends inclusive.
+        y_range (tuple of int): Index range along y, both ends inclusive.
+    """
+    slices = {
+        dim: slice(
+            max(start - int(ds[dim][0]), 0),
+            min(end - int(ds[dim][0]) + 1, ds.sizes[dim]),
+        )
+        for dim, (start, end) in zip(["x", "y"], [x_range, y_range])
+    }
+    cropped = ds.isel(slices)
+    for name, var in ds.data_vars.items():
+        # the cropped data doesn't cover the mosaic anymore
+        cropped[name].encoding.pop(MOSAIC_ENCODING, None)
+        if "preferred_chunks" in var.encoding:
+            cropped[name].encoding["preferred_chunks"] = {
+                dim: _crop_sizes(sizes, slices[dim].start, slices[dim].stop)
+                for dim, sizes in var.encoding["preferred_chunks"].items()
+            }
+    return cropped
+
+
+def _chunk_mosaic(ds, chunks=None):
+    """Chunks a mosaic Dataset with tile-aligned chunks along x and y.
+
+    Args:
+        ds (xarray.Dataset): Dataset opened with `_mosaic_dataset`.
+        chunks (int or dict): Chunk size of all or of individual dimensions. Chunks
+            along x and y are aligned with the tiles (see `_tile_aligned_chunks`).
+            (default: one chunk per tile)
+    """
+    tile_sizes = next(
+        var.encoding["preferred_chunks"]
+        for var in ds.data_vars.values()
+        if "preferred_chunks" in var.encoding
+    )
+    if not isinstance(chunks, dict):
+        chunks = {dim: chunks for dim in ds.dims if dim in ["x", "y", "z"]}
+    chunks = {
+        **{dim: size for dim, size in chunks.items() if dim not in ["x", "y"]},
+        "y": _tile_aligned_chunks(tile_sizes["y"], chunks.get("y")),
+        "x": _tile_aligned_chunks(tile_sizes["x"], chunks.get("x")),
+    }
+    # coordinates are already in memory, only the data variables are chunked
+    chunked = ds.assign(
+        {
+            name: var.chunk({dim: chunks[dim] for dim in var.dims if dim in chunks})
+            for name, var in ds.data_vars.items()
+        }
+    )
+    for var in chunked.data_vars.values():
+        tag = var.encoding.get(MOSAIC_ENCODING)
+        if tag is not None:
+            var.encoding[MOSAIC_ENCODING] = {**tag, "name": var.data.name}
+    return chunked
+
+
+def _open_mosaic(filenames, dtype, chunks=None, **kwargs):
+    """Opens all tiles as one Dataset, by default with one dask chunk per tile.
+
+    Args:
+        filenames (iterable of str,pathlib.Path or dict): Tile files of the dataset,
+            optionally mapped to their (x, y) index ranges.
+        dtype (str,numpy.dtype): Datatype of the tiles.
+        chunks (int or dict): Chunk sizes, see `_chunk_mosaic`.
+        **kwargs: Decoding options passed on to `_mosaic_dataset`.
+    """
+    return _chunk_mosaic(_mosaic_dataset(filenames, dtype, **kwargs), chunks)
@@ -0,0 +1,108 @@
+"""Builds overviews, i.e. coarsened copies of a dataset for browsing."""
+
+import copy
+from pathlib import Path
+
+import dask.array as da
+import numpy as np
+
+from .coarsen import coarsen
+from .config import config
+from .index import _write_index
+from .manifest import write_manifest
+from .wps import _level_path, open_dataset
+from .wps_accessor import _infer_var_name, _prepare_wps_directory, _tile_store_target
+
+
+def _overview_tile_size(chunk, extent, max_size):
+    """Groups coarsened tiles into overview tiles of at most `max_size` cells.
+
+    Note:
+        The overview tile size is a multiple of `chunk` dividing `extent`, so tiles
+        don't need to be padded, falling back to `chunk` if there is none. Extents
+        fitting into `max_size` are written as a single tile.
+
+    Examples:
+        >>> _overview_tile_size(150, 5400, 1200)
+        900
+    """
+    if extent <= max_size:
+        return extent
+    for size in range(max_size // chunk * chunk, 0, -chunk):
+        if extent % size == 0:
+            return size
+    return chunk
+
+
+def build_overviews(pathname_or_obj, levels=None, force=False):
+    """Writes overviews of a WPS dataset into subdirectories of its directory.
+
+    Level `n` halves the resolution `n` times, using the majority category for
+    categorical and the mean for continuous data, and is a WPS dataset on its own,
+    in the same tile format and with its own `index`. It can be opened with
+    `open_dataset(pathname_or_obj, level=n)`.
+
+    Note:
+        Every level is coarsened from the full resolution, and all levels are written
+        from a single dask graph, so every tile of the dataset is read only once.
+        Afterwards, the wps_xr.config object holds the `index` of the dataset.
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Directory of the dataset.
+        levels (int): Number of levels. (default: until the dataset fits into a tile)
+        force (bool): Whether to override existing overviews. (default: False)
+
+    Raises:
+        KeyError: If overview tiles need to be padded, but `index.missing_value` is
+            not set in config.
+    """
+    pathname_or_obj = Path(pathname_or_obj)
+    ds = open_dataset(pathname_or_obj)
+    var = _infer_var_name(ds, None)
+    index = copy.deepcopy(config.get("index"))
+    max_tile = (index["tile_x"], index["tile_y"])
+    if levels is None:
+        levels = max(
+            int(np.ceil(np.log2(ds.sizes[dim] / size)))
+            for dim, size in zip(["x", "y"], max_tile)
+        )
+
+    sources, targets, indices = [], [], {}
+    for level in range(1, levels + 1):
+        # coarsening sets the grid of the level in config, which is only needed for
+        # its index, as the dataset is still read with its own index
+        with config.set({"index": copy.deepcopy(index)}):
+            data = coarsen(ds, 2**level, var=var)[var]
+            tile_size = tuple(
+                _overview_tile_size(data.chunks[axis][0], data.sizes[dim], size)
+                for axis, dim, size in zip([1, 0], ["x", "y"], max_tile)
+            )
+            config.set(
+                {
+                    "index.tile_x": tile_size[0],
+                    "index.tile_y": tile_size[1],
+                    "index.tile_bdr": 0,
+                }
+            )
+            indices[level] = copy.deepcopy(config.get("index"))
+        dirname = _level_path(pathname_or_obj, level)
+        _prepare_wps_directory(dirname, force)
+        arr, writer = _tile_store_target(dirname, data, tile_size)
+        sources.append(arr)
+        targets.append(writer)
+
+    da.store(
+        sources,
+        targets,
+        lock=False,
+        scheduler="threads",
+        num_workers=config.get("writer.num_workers"),
+    )
+
+    for level, level_index in indices.items():
+        dirname = _level_path(pathname_or_obj, level)
+        with config.set({"index": level_index}):
+            _write_index(dirname)
+            write_manifest(dirname)
+    # the overview directories modified the directory of the dataset
+    write_manifest(pathname_or_obj)
@@ -0,0 +1,290 @@
+"""Reads and writes per-tile statistics, a sidecar file summarizing every tile."""
+
+import json
+from pathlib import Path
+
+import dask
+import dask.array
+import numpy as np
+import xarray as xr
+
+from .backend_array import ConstantBackendArray
+from .categorical import _histogram_kernel
+from .config import config
+from .manifest import _find_tiles, _manifest_path, write_manifest
+from .mosaic import _find_mosaic
+
+STATS_VERSION = 1
+
+
+def _stats_path(pathname_or_obj):
+    return Path(pathname_or_obj) / config.get("stats.filename")
+
+
+def _categories(index):
+    """Returns the first category and the number of categories, or None."""
+    if index.get("type") != "categorical":
+        return None
+    return index["category_min"], index["category_max"] - index["category_min"] + 1
+
+
+def _block_stats(block, missing_value=None, scale_factor=1, categories=None):
+    """Computes the statistics of a block of raw or decoded data.
+
+    Args:
+        block (numpy.ndarray): Data of the block, NaN or `missing_value` where missing.
+        missing_value (int): Raw value of missing cells. (default: None)
+        scale_factor (float): Factor to scale the raw data with. (default: 1)
+        categories (tuple of int): First category and number of categories, to count
+            the cells of every category. (default: None)
+
+    Returns:
+        stats (dict): `count` and `valid` count of cells, `min`, `max` and `sum` of
+            the valid cells, and the `histogram` of categories.
+    """
+    valid = ~np.isnan(block) if block.dtype.kind == "f" else np.ones(block.shape, bool)
+    if missing_value is not None:
+        valid &= block != missing_value
+    values = block[valid]
+    stats = {
+        "count": int(block.size),
+        "valid": int(values.size),
+        "min": values.min().item() * scale_factor if values.size else None,
+        "max": values.max().item() * scale_factor if values.size else None,
+        "sum": float(values.sum(dtype="float64")) * scale_factor,
+    }
+    if categories is not None:
+        histogram = _histogram_kernel(
+            block, valid, cmin=categories[0], ncat=categories[1]
+        )
+        stats["histogram"] = histogram.ravel().tolist()
+    return stats
+
+
+def _merge_stats(stats, other):
+    """Merges the statistics of two blocks, e.g. of two z-levels of a tile."""
+    if stats is None:
+        return other
+    merged = {
+        "count": stats["count"] + other["count"],
+        "valid": stats["valid"] + other["valid"],
+        "sum": stats["sum"] + other["sum"],
+    }
+    for key, func in [("min", min), ("max", max)]:
+        values = [s[key] for s in (stats, other) if s[key] is not None]
+        merged[key] = func(values) if values else None
+    if "histogram" in stats:
+        merged["histogram"] = [
+            a + b for a, b in zip(stats["histogram"], other["histogram"])
+        ]
+    if "empty" in stats and "empty" in other:
+        merged["empty"] = stats["empty"] and other["empty"]
+    return merged
+
+
+def write_stats(pathname_or_obj, tile_stats):
+    """Writes the per-tile statistics of a WPS dataset next to its `index` file.
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Directory of the dataset.
+        tile_stats (dict): Maps tile names to their statistics (see `_block_stats`).
+    """
+    pathname_or_obj = Path(pathname_or_obj)
+    tiles = {}
+    for name, stats in sorted(tile_stats.items()):
+        stat = (pathname_or_obj / name).stat()
+        tiles[name] = {**stats, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    with open(_stats_path(pathname_or_obj), "w") as f:
+        json.dump({"version": STATS_VERSION, "tiles": tiles}, f)
+
+
+def _read_stats(pathname_or_obj):
+    """Reads the per-tile statistics of a WPS dataset.
+
+    Note:
+        The statistics are not checked against the tiles here, see `_unchanged`.
+
+    Returns:
+        tiles (dict or None): Maps tile names to their statistics, or None if there
+            are no statistics.
+    """
+    try:
+        with open(_stats_path(pathname_or_obj)) as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stats.get("version") != STATS_VERSION:
+        return None
+    return stats["tiles"]
+
+
+def _unchanged(pathname_or_obj, name, stats):
+    """Checks whether a tile still has the size and mtime recorded in its statistics."""
+    try:
+        stat = (Path(pathname_or_obj) / name).stat()
+    except OSError:
+        return False
+    return (stat.st_size, stat.st_mtime_ns) == (stats["size"], stats["mtime_ns"])
+
+
+def _empty_tiles(pathname_or_obj):
+    """Returns the names of the tiles known to be entirely `missing_value`.
+
+    Tiles are only empty if their halo is `missing_value` everywhere as well.
+
+    Note:
+        Only the size and mtime of these tiles are checked against their statistics.
+    """
+    tiles = _read_stats(pathname_or_obj) or {}
+    return [
+        name
+        for name, stats in tiles.items()
+        if stats["empty"] and _unchanged(pathname_or_obj, name, stats)
+    ]
+
+
+def _constant_stats(tile, missing_value=None, scale_factor=1, categories=None):
+    """Computes the statistics of a `ConstantBackendArray` without broadcasting it."""
+    stats = _block_stats(tile.value.reshape(1), missing_value, scale_factor, categories)
+    size = int(np.prod(tile.shape))
+    stats.update(count=size, valid=stats["valid"] * size, sum=stats["sum"] * size)
+    if "histogram" in stats:
+        stats["histogram"] = [count * size for count in stats["histogram"]]
+    return stats
+
+
+def _read_tile_stats(tile, index):
+    bdr = tile.tile_bdr
+    arr = tile._tile_view(halo=bdr)
+    missing_value = index.get("missing_value")
+    stats = _block_stats(
+        arr[bdr : arr.shape[0] - bdr, bdr : arr.shape[1] - bdr],
+        missing_value,
+        index.get("scale_factor", 1),
+        _categories(index),
+    )
+    stats["empty"] = missing_value is not None and bool((arr == missing_value).all())
+    return stats
+
+
+def build_stats(pathname_or_obj):
+    """Computes and writes the per-tile statistics of a WPS dataset.
+
+    Note:
+        The tiles are read raw in parallel, with `writer.num_workers` threads.
+        `to_disk` writes the statistics while writing the tiles.
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Directory of the dataset.
+    """
+    # imported here, as wps imports this module to skip empty tiles
+    from .wps import open_dataset
+
+    pathname_or_obj = Path(pathname_or_obj)
+    # empty tiles are read as well, only absent tiles are left out, and the tiles
+    # are read even if a cache of the dataset is registered
+    with config.set({"stats.use": False, "cache.use": False}):
+        ds = open_dataset(pathname_or_obj)
+    index = config.get("index")
+    mosaic, _ = _find_mosaic(ds[list(ds.data_vars)[0]])
+    tiles = {
+        Path(tile.filename_or_obj).name: tile
+        for tile in mosaic.tiles.values()
+        if not isinstance(tile, ConstantBackendArray)
+    }
+    (stats,) = dask.compute(
+        {
+            name: dask.delayed(_read_tile_stats)(tile, index)
+            for name, tile in tiles.items()
+        },
+        scheduler="threads",
+        num_workers=config.get("writer.num_workers"),
+    )
+    has_manifest = _manifest_path(pathname_or_obj).is_file()
+    write_stats(pathname_or_obj, stats)
+    if has_manifest:
+        # creating the statistics modified the directory of the dataset
+        write_manifest(pathname_or_obj)
+
+
+def _as_dataset(stats, categories=None):
+    summary = {
+        "count": stats["count"],
+        "valid": stats["valid"],
+        "min": np.nan if stats["min"] is None else stats["min"],
+        "max": np.nan if stats["max"] is None else stats["max"],
+        "sum": stats["sum"],
+        "mean": stats["sum"] / stats["valid"] if stats["valid"] else np.nan,
+    }
+    ds = xr.Dataset({key: ((), value) for key, value in summary.items()})
+    if "histogram" in stats:
+        ds["histogram"] = xr.DataArray(
+            stats["histogram"],
+            dims="category",
+            coords={
+                "category": np.arange(categories[0], categories[0] + categories[1])
+            },
+        )
+    return ds
+
+
+def summarize(ds, var):
+    """Summarizes a variable from the statistics of its tiles, or by computing them.
+
+    Note:
+        The statistics of the tiles are used if the variable comes straight from the
+        tiles of a dataset, and they cover all of its tiles unchanged. Absent tiles
+        only count as missing cells.
+
+    Args:
+        ds (xarray.Dataset): WPS dataset.
+        var (str): Name of variable to summarize.
+
+    Returns:
+        summary (xarray.Dataset): `count`, `valid`, `min`, `max`, `sum` and `mean`,
+            and the `histogram` of categories for categorical data.
+    """
+    data = ds[var]
+    attrs = {**data.attrs, **ds.attrs}
+    categories = _categories(attrs)
+    directory = ds.attrs.get("directory")
+    mosaic, _ = _find_mosaic(data)
+    if mosaic is not None and directory is not None:
+        found = {Path(fn).name for fn in _find_tiles(directory)}
+        tiles = _read_stats(directory) or {}
+        stats = None
+        for tile in sorted(
+            mosaic.tiles.values(), key=lambda tile: Path(tile.filename_or_obj).name
+        ):
+            name = Path(tile.filename_or_obj).name
+            found.discard(name)
+            if name in tiles and _unchanged(directory, name, tiles[name]):
+                tile_stats = tiles[name]
+            elif isinstance(tile, ConstantBackendArray):
+                tile_stats = _constant_stats(
+                    tile,
+                    attrs.get("missing_value"),
+                    attrs.get("scale_factor", 1),
+                    categories,
+                )
+            else:
+                break
+            stats = _merge_stats(stats, tile_stats)
+        else:
+            # the mosaic has to cover every tile of the dataset
+            if not found:
+                return _as_dataset(stats, categories)
+
+    # decoded data is masked with NaN, compact data keeps `missing_value`
+    missing_value = attrs.get("missing_value") if data.dtype.kind != "f" else None
+    blocks = dask.array.asarray(data.data).to_delayed().ravel()
+    stats = dask.compute(
+        *[
+            dask.delayed(_block_stats)(block, missing_value, 1, categories)
+            for block in blocks
+        ]
+    )
+    merged = None
+    for block_stats in stats:
+        merged = _merge_stats(merged, block_stats)
+    return _as_dataset(merged, categories)
@@ -1,7 +1,19 @@
+import bz2
+import gzip
+import lzma
 from pathlib import Path
 
 import numpy as np
 
+from .config import config
+
+# filename suffix, compress and decompress function and level keyword of every codec
+CODECS = {
+    "gzip": (".gz", gzip.compress, gzip.decompress, "compresslevel"),
+    "lzma": (".xz", lzma.compress, lzma.decompress, "preset"),
+    "bz2": (".bz2", bz2.compress, bz2.decompress, "compresslevel"),
+}
+
 
 def wps_static_filename_to_idx(_file):
     """Extracts tile indices from filename
@@ -13,9 +25,38 @@ def wps_static_filename_to_idx(_file):
         (array([   1, 1200]), array([1201, 2400]))
         >>> wps_static_filename_to_idx("000001-001200.001201-002400")
         (array([   1, 1200]), array([1201, 2400]))
+        >>> wps_static_filename_to_idx("00001-01200.01201-02400.gz")
+        (array([   1, 1200]), array([1201, 2400]))
     """
     idxtmp = []
-    _file = Path(_file).name
+    _file, _ = _split_codec(_file)
     for part in _file.split("."):
         idxtmp.append(np.array(list(map(int, part.split("-")))))
     return tuple(idxtmp)
+
+
+def _tile_filename(xstart, xend, ystart, yend):
+    def _fmt(x):
+        return f"{x:0{config.get('index.filename_digits')}d}"
+
+    return f"{_fmt(xstart)}-{_fmt(xend)}.{_fmt(ystart)}-{_fmt(yend)}"
+
+
+def _split_codec(filename):
+    """Splits the suffix of a compressed tile off its filename.
+
+    Examples:
+        >>> _split_codec("00001-01200.01201-02400.xz")
+        ('00001-01200.01201-02400', 'lzma')
+        >>> _split_codec("00001-01200.01201-02400")
+        ('00001-01200.01201-02400', None)
+
+    Returns:
+        name (str): Name of the tile without the suffix.
+        codec (str or None): Codec the tile is compressed with, if any.
+    """
+    name = Path(filename).name
+    for codec, (suffix, *_) in CODECS.items():
+        if name.endswith(suffix):
+            return name[: -len(suffix)], codec
+    return name, None
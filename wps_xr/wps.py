@@ -1,10 +1,21 @@
+import copy
 from pathlib import Path
 
+import numpy as np
 import xarray as xr
 
-from .backend import BinaryBackend
+from .cache import _open_fresh_cache
 from .config import config
 from .index import _construct_index
+from .manifest import _absent_tiles, _find_tiles
+from .mosaic import (
+    _chunk_mosaic,
+    _crop_mosaic,
+    _generate_decoding_from_config,
+    _mosaic_dataset,
+    _select_tiles,
+)
+from .stats import _empty_tiles
 
 
 def _add_latlon_coords(ds):
@@ -26,6 +37,47 @@ def _add_latlon_coords(ds):
     return ds
 
 
+def _latlon_to_index(lat, lon, grid):
+    """Converts lat/lon to fractional x/y indices, the inverse of `_add_latlon_coords`.
+
+    Note:
+        At the moment, this only supports `regular_ll` projections.
+
+    Args:
+        lat, lon (float or numpy.ndarray): Coordinates to convert.
+        grid (dict): `projection`, `dx`, `dy`, `known_x`, `known_y`, `known_lat` and
+            `known_lon`, e.g. the index from wps_xr.config or the Dataset attributes.
+
+    Returns:
+        x, y (float or numpy.ndarray): Indices, integral at the cell centers.
+    """
+    assert grid["projection"] == "regular_ll"
+    x = (np.asarray(lon) - grid["known_lon"]) / grid["dx"] + grid["known_x"]
+    y = (np.asarray(lat) - grid["known_lat"]) / grid["dy"] + grid["known_y"]
+    return x, y
+
+
+def _bbox_to_index_range(bbox):
+    """Converts a lat/lon bounding box to the index ranges of the cells it intersects.
+
+    Args:
+        bbox (tuple of float): (lon0, lat0, lon1, lat1) with lon0 < lon1, lat0 < lat1.
+
+    Returns:
+        x_range, y_range (tuple of int): Index ranges, both ends inclusive.
+    """
+    lon0, lat0, lon1, lat1 = bbox
+    if lon0 > lon1 or lat0 > lat1:
+        raise ValueError(f"Invalid bounding box {bbox}.")
+    starts = _latlon_to_index(lat0, lon0, config.get("index"))
+    ends = _latlon_to_index(lat1, lon1, config.get("index"))
+    # a cell intersects the box if it lies within half a cell of it
+    return tuple(
+        (int(np.floor(start + 0.5)), int(np.ceil(end - 0.5)))
+        for start, end in zip(starts, ends)
+    )
+
+
 def _generate_dtype_from_config():
     """Generates datatype from wps_xr.config object
 
@@ -36,24 +88,43 @@ def _generate_dtype_from_config():
     endian_str = (
         ""
         if config.get("index.wordsize") == 1
-        else "<"
-        if config.get("index.endian") == "little"
-        else ">"
+        else "<" if config.get("index.endian") == "little" else ">"
     )
     return f"{endian_str}{int_str}{config.get('index.wordsize')}"
 
 
-def open_dataset(pathname_or_obj):
-    """Opens a WPS geogrid binary dataset as an xarray.Dataset object and populates config
+def _level_path(pathname_or_obj, level):
+    """Returns the directory of an overview level, level 0 being the dataset itself."""
+    if level == 0:
+        return Path(pathname_or_obj)
+    return Path(pathname_or_obj) / config.get("overview.dirname").format(level=level)
 
-    Note:
-        I know this might not be the prettiest way of solving this, but this method
-        implicitly populates the wps_xr.config object, which is needed for the Backend.
+
+def _available_levels(pathname_or_obj):
+    """Returns the overview levels of a dataset, in ascending order."""
+    levels, level = [], 1
+    while (_level_path(pathname_or_obj, level) / "index").is_file():
+        levels.append(level)
+        level += 1
+    return levels
+
+
+def _open_lazy_dataset(pathname_or_obj, level=0, bbox=None):
+    """Opens a WPS geogrid binary dataset lazily, without dask, and populates config.
 
     Args:
         pathname_or_obj (str,pathlib.Path): Path of the dataset to open
+        level (int): Overview level to open, 0 for the full resolution. (default: 0)
+        bbox (tuple of float): (lon0, lat0, lon1, lat1) to crop the dataset to, only
+            the tiles intersecting it are opened. (default: the whole dataset)
     """
-    pathname_or_obj = Path(pathname_or_obj)
+    name = Path(pathname_or_obj).name
+    pathname_or_obj = _level_path(pathname_or_obj, level)
+    if level and not (pathname_or_obj / "index").is_file():
+        raise FileNotFoundError(
+            f"Overview level {level} doesn't exist, please build it with "
+            "`build_overviews` first."
+        )
 
     if not pathname_or_obj.is_dir() and not (pathname_or_obj / "index").exists():
         raise Exception("Please provide the directory of a proper WPS binary dataset.")
@@ -61,23 +132,40 @@ def open_dataset(pathname_or_obj):
     index = _construct_index(pathname_or_obj)
     config.update(dict(index=index), priority="new")
 
+    tiles = _find_tiles(pathname_or_obj)
+    if bbox is not None:
+        x_range, y_range = _bbox_to_index_range(bbox)
+        tiles = _select_tiles(tiles, x_range, y_range)
+        if not tiles:
+            raise ValueError(f"Bounding box {bbox} doesn't intersect the dataset.")
+
+    # absent and empty tiles hold `missing_value` everywhere and are never read
+    constants = {}
+    missing_value = config.get("index").get("missing_value")
+    if missing_value is not None:
+        absent = _absent_tiles(pathname_or_obj)
+        constants.update({name: missing_value for name in absent})
+        if config.get("stats.use"):
+            empty = _empty_tiles(pathname_or_obj)
+            constants.update({name: missing_value for name in empty})
+
     # construct field variable
-    index_str = "?" * config.get("index.filename_digits")
-    ds = xr.open_mfdataset(
-        pathname_or_obj.glob(f"{index_str}-{index_str}.{index_str}-{index_str}"),
-        engine=BinaryBackend,
+    # missing values are masked and scaled right after reading
+    ds = _mosaic_dataset(
+        tiles,
         dtype=_generate_dtype_from_config(),
-        combine="by_coords",
+        constants=constants,
+        fill_value=missing_value,
+        **_generate_decoding_from_config(),
     )
-    if "missing_value" in config.get("index"):
-        ds["foo"] = ds.foo.where(ds.foo != config.get("index.missing_value"))
-    ds["foo"] = ds.foo * config.get("index.scale_factor")
+    if bbox is not None:
+        ds = _crop_mosaic(ds, x_range, y_range)
     ds.foo.attrs = {
         key: config.get("index")[key]
         for key in config.get("index").keys()
         if key not in config.get("general.GLOBAL_ATTRS")
     }
-    ds = ds.rename({"foo": pathname_or_obj.name})
+    ds = ds.rename({"foo": name})
 
     # add global attributes
     ds.attrs = {"directory": str(pathname_or_obj)}
@@ -91,3 +179,106 @@ def open_dataset(pathname_or_obj):
 
     ds = _add_latlon_coords(ds)
     return ds
+
+
+def open_dataset(pathname_or_obj, chunks=None, level=0, bbox=None):
+    """Opens a WPS geogrid binary dataset as an xarray.Dataset object and populates config
+
+    Note:
+        I know this might not be the prettiest way of solving this, but this method
+        implicitly populates the wps_xr.config object, which is needed for the Backend.
+        If a cache written by `ds.wps.to_cache` is registered with the dataset and
+        still fresh, the cache is opened instead of the tiles (see `cache.use`).
+
+    Args:
+        pathname_or_obj (str,pathlib.Path): Path of the dataset to open
+        chunks (int or dict): Chunk size of all or of individual dimensions. Along x
+            and y, tiles larger than the chunk size are split into blocks and smaller
+            ones grouped, so no chunk straddles a tile boundary. (default: one per tile)
+        level (int): Overview level to open, written by `build_overviews`, each level
+            halving the resolution. (default: 0, the full resolution)
+        bbox (tuple of float): (lon0, lat0, lon1, lat1) to crop the dataset to. Only
+            the tiles intersecting it are opened, picked by their filenames.
+            (default: the whole dataset)
+    """
+    if level == 0 and config.get("cache.use"):
+        ds = _open_fresh_cache(pathname_or_obj, chunks)
+        if ds is not None:
+            if bbox is None:
+                return ds
+            x_range, y_range = _bbox_to_index_range(bbox)
+            ds = ds.sel(x=slice(*x_range), y=slice(*y_range))
+            if not ds.sizes["x"] or not ds.sizes["y"]:
+                raise ValueError(f"Bounding box {bbox} doesn't intersect the dataset.")
+            return ds
+    return _chunk_mosaic(_open_lazy_dataset(pathname_or_obj, level, bbox), chunks)
+
+
+def _select_overview(ds, var, cells):
+    """Returns the coarsest overview of a variable still fine enough for plotting.
+
+    Note:
+        The level is chosen so at least `cells` cells remain along x and y, and the
+        overview is cut to the lat/lon extent of `ds` and loaded. If there is no such
+        overview, `ds` is returned as is.
+
+    Args:
+        ds (xarray.Dataset): The dataset, or a part of it.
+        var (str): Name of variable to plot.
+        cells (tuple of int): Minimum number of cells in x, y direction.
+    """
+    directory = ds.attrs.get("directory")
+    if directory is None:
+        return ds
+    levels = [
+        level
+        for level in _available_levels(directory)
+        if ds[var].sizes["x"] // 2**level >= cells[0]
+        and ds[var].sizes["y"] // 2**level >= cells[1]
+    ]
+    if not levels:
+        return ds
+
+    # the overview is read with its own index, the config is restored afterwards
+    with config.set({"index": copy.deepcopy(config.get("index"))}):
+        overview = open_dataset(directory, level=levels[-1])
+        half_dx = overview.attrs["dx"] / 2
+        half_dy = overview.attrs["dy"] / 2
+        overview = overview.isel(
+            x=(
+                (overview.lon >= float(ds.lon.min()) - half_dx)
+                & (overview.lon <= float(ds.lon.max()) + half_dx)
+            ).values,
+            y=(
+                (overview.lat >= float(ds.lat.min()) - half_dy)
+                & (overview.lat <= float(ds.lat.max()) + half_dy)
+            ).values,
+        ).load()
+    overview[var].attrs = ds[var].attrs
+    return overview
+
+
+class WPSBackend(xr.backends.BackendEntrypoint):
+    """Opens WPS geogrid binary datasets with `xarray.open_dataset(..., engine="wps")`.
+
+    Note:
+        The variables are lazily indexed, so chunking and caching are left to xarray.
+        With `chunks={}`, every tile becomes one dask chunk. Like `open_dataset`, this
+        populates the wps_xr.config object. Overviews are opened with `level=n`.
+    """
+
+    description = "Open WPS geogrid binary datasets in xarray"
+    url = "https://github.com/lpilz/wps_xr"
+    open_dataset_parameters = ("filename_or_obj", "drop_variables", "level", "bbox")
+
+    def open_dataset(self, filename_or_obj, *, drop_variables=None, level=0, bbox=None):
+        ds = _open_lazy_dataset(filename_or_obj, level, bbox)
+        if drop_variables is not None:
+            ds = ds.drop_vars(drop_variables)
+        return ds
+
+    def guess_can_open(self, filename_or_obj):
+        try:
+            return (Path(filename_or_obj) / "index").is_file()
+        except TypeError:
+            return False
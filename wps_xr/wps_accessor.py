@@ -1,15 +1,38 @@
 import math
+import os
 import shutil
+import threading
 from collections.abc import Iterable
 from pathlib import Path
 
+import dask.array as da
 import numpy as np
 import xarray as xr
 from loguru import logger
 
+from .cache import to_cache
+from .categorical import category_fractions, category_histogram
+from .coarsen import _coarsen_array, coarsen
+from .compression import _compress
 from .config import config
 from .index import _write_index
-from .wps import _add_latlon_coords, _generate_dtype_from_config
+from .manifest import write_manifest
+from .mosaic import _find_mosaic, _map_tile_halos, _sample_mosaic
+from .stats import (
+    _block_stats,
+    _categories,
+    _merge_stats,
+    build_stats,
+    summarize,
+    write_stats,
+)
+from .utils import CODECS, _tile_filename
+from .wps import (
+    _add_latlon_coords,
+    _generate_dtype_from_config,
+    _latlon_to_index,
+    _select_overview,
+)
 
 
 def _prepare_wps_directory(dirname_or_obj, force=False):
@@ -73,6 +96,26 @@ def _pad_data_if_needed(da, tile_size):
     return da
 
 
+def _limit_to_view(ds, ax):
+    """Selects the cells of a Dataset within the lat/lon limits set on the axes.
+
+    Note:
+        Limits are only applied if they were set, i.e. autoscaling is turned off, and
+        the selection is lazy, so only the tiles within the limits are read.
+    """
+    selection = {}
+    for dim, coord, spacing, autoscale, limits in [
+        ("x", "lon", "dx", ax.get_autoscalex_on(), ax.get_xlim()),
+        ("y", "lat", "dy", ax.get_autoscaley_on(), ax.get_ylim()),
+    ]:
+        if not autoscale:
+            half = ds.attrs.get(spacing, 0) / 2
+            selection[dim] = (
+                (ds[coord] + half >= min(limits)) & (ds[coord] - half <= max(limits))
+            ).values
+    return ds.isel(selection)
+
+
 def _infer_var_name(ds, var):
     if var is None:
         if len(ds.data_vars) > 1:
@@ -82,29 +125,298 @@ def _infer_var_name(ds, var):
     return var
 
 
-def _write_data_to_files(dirname, data, tile_nums, tile_size):
-    """Outputs data into files depending on tile definitions
+class _TileWriter:
+    """Target for `dask.array.store`, which writes every stored block to its tile.
+
+    Note:
+        Blocks have to be aligned with the tiles and include their halo. Right before
+        writing, one tile at a time, NaNs are filled and blocks at the domain edge
+        padded with `index.missing_value`, and the block is converted to the index
+        datatype and row order. With `skip_empty`, blocks that are `missing_value`
+        everywhere, halo included, are not written, and `finish` has to be called
+        after storing. With `compression`, every block has to hold all z-levels of its
+        tile, which is written compressed at once.
+
+    Args:
+        dirname (pathlib.Path): Directory to write the tiles to.
+        x0 (int): x index of the first column of the data.
+        y0 (int): y index of the first row of the data.
+        tile_size (tuple of int): Size of tiles in x, y direction.
+        tile_bdr (int): Width of the halo around every block. (default: 0)
+        nz (int): Number of z-levels of 3-D data. (default: 1)
+        skip_empty (bool): Whether to skip blocks without any valid cell.
+            (default: False)
+        compression (str): Codec to compress the tiles with, "gzip", "lzma" or "bz2".
+            (default: None)
+    """
+
+    def __init__(
+        self,
+        dirname,
+        x0,
+        y0,
+        tile_size,
+        tile_bdr=0,
+        nz=1,
+        skip_empty=False,
+        compression=None,
+    ):
+        self.dirname = dirname
+        self.compression = compression
+        self.stats = {}
+        self.absent = []
+        self.skip_empty = skip_empty
+        self._written = set()
+        self._skipped = []
+        self._stats_lock = threading.Lock()
+        # tiles mapped for writing z-levels, with the number of levels written so far
+        self._mapped = {}
+        self._mapped_lock = threading.Lock()
+        self.categories = _categories(config.get("index"))
+        self.nz = nz
+        self.x0 = x0
+        self.y0 = y0
+        self.tile_size = tile_size
+        self.tile_bdr = tile_bdr
+        self.dtype = _generate_dtype_from_config()
+        self.scale_factor = config.get("index.scale_factor")
+        self.missing_value = config.get("index").get("missing_value")
+        self.flip = config.get("index.row_order") == "top_bottom"
+
+    def __setitem__(self, key, value):
+        padshp = [size + 2 * self.tile_bdr for size in self.tile_size]
+        xstart = self.x0 + key[1].start // padshp[0] * self.tile_size[0]
+        ystart = self.y0 + key[0].start // padshp[1] * self.tile_size[1]
+        filename = _tile_filename(
+            xstart,
+            xstart + self.tile_size[0] - 1,
+            ystart,
+            ystart + self.tile_size[1] - 1,
+        )
+        if self.compression is not None:
+            filename += CODECS[self.compression][0]
+        missing = np.isnan(value) if value.dtype.kind in "fc" else None
+        padding = [
+            (0, padshp[1] - value.shape[0]),
+            (0, padshp[0] - value.shape[1]),
+        ] + [(0, 0)] * (value.ndim - 2)
+        needs_missing_value = (missing is not None and missing.any()) or any(
+            pad for _, pad in padding
+        )
+        if needs_missing_value and self.missing_value is None:
+            raise KeyError(
+                f"Couldn't write {filename} since index.missing_value is not set in "
+                "config."
+            )
+
+        if self.scale_factor != 1 or value.dtype.kind == "f":
+            value = np.round(value / self.scale_factor)
+        if missing is not None and needs_missing_value:
+            value = np.where(missing, self.missing_value, value)
+        # padding doesn't add any valid cells
+        empty = self.missing_value is not None and (value == self.missing_value).all()
+        self._add_stats(filename, value, bool(empty))
+        if needs_missing_value:
+            value = np.pad(value, padding, constant_values=self.missing_value)
+        if self.skip_empty and empty:
+            with self._stats_lock:
+                self._skipped.append((filename, key[2:], value.shape))
+            return
+        with self._stats_lock:
+            self._written.add(filename)
+        if self.flip:
+            value = value[::-1, ...]
+        if self.compression is not None:
+            data = np.ascontiguousarray(value, dtype=self.dtype).tobytes()
+            (self.dirname / filename).write_bytes(_compress(data, self.compression))
+        elif value.ndim == 2:
+            np.ascontiguousarray(value, dtype=self.dtype).tofile(
+                self.dirname / filename
+            )
+        else:
+            self._write_levels(self.dirname / filename, key[2], value)
+
+    def finish(self):
+        """Completes the tiles after storing, if empty blocks were skipped.
+
+        Note:
+            Skipped z-levels of tiles with other levels written are filled with
+            `missing_value`, while tiles without any written block remain absent.
+        """
+        for filename, zkey, shape in self._skipped:
+            if filename in self._written:
+                value = np.full(shape, self.missing_value)
+                self._write_levels(self.dirname / filename, zkey[0], value)
+        self.absent = sorted(set(self.stats) - self._written)
+        self.stats = {
+            name: stats for name, stats in self.stats.items() if name in self._written
+        }
+
+    def _add_stats(self, filename, value, empty):
+        """Adds the statistics of the tile, without its halo, as written to disk.
+
+        Note:
+            `empty` marks tiles without any valid cell, halo included.
+        """
+        bdr = self.tile_bdr
+        stats = _block_stats(
+            value[bdr : bdr + self.tile_size[1], bdr : bdr + self.tile_size[0]],
+            self.missing_value,
+            self.scale_factor,
+            self.categories,
+        )
+        # padded cells count as missing
+        stats["count"] = int(np.prod(self.tile_size)) * int(np.prod(value.shape[2:]))
+        stats["empty"] = empty
+        with self._stats_lock:
+            self.stats[filename] = _merge_stats(self.stats.get(filename), stats)
+
+    def _write_levels(self, filename, zkey, value):
+        """Writes some z-levels into a tile, which holds the levels of every cell.
+
+        Note:
+            The tile is created at its full size and mapped once, so levels can be
+            written in any order and concurrently into the same mapping. As the levels
+            of every cell are interleaved, each level touches every page of the tile,
+            so the tile is only flushed and unmapped once all levels are written.
+        """
+        with self._mapped_lock:
+            if filename not in self._mapped:
+                self._mapped[filename] = [self._map_tile(filename, value.shape[:2]), 0]
+            tile = self._mapped[filename]
+        tile[0][..., zkey] = value
+        with self._mapped_lock:
+            tile[1] += np.arange(self.nz)[zkey].size
+            complete = tile[1] == self.nz
+            if complete:
+                del self._mapped[filename]
+        if complete:
+            tile[0].flush()
+
+    def _map_tile(self, filename, shape):
+        """Creates a tile at its full size and maps it for writing."""
+        shape = tuple(shape) + (self.nz,)
+        size = int(np.prod(shape)) * np.dtype(self.dtype).itemsize
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        return np.memmap(filename, dtype=self.dtype, mode="r+", shape=shape)
+
+
+def _add_halos(arr, tile_size, tile_bdr):
+    """Adds the halo of neighbouring tiles to every tile-aligned chunk.
+
+    Note:
+        The array is first padded lazily to whole tiles. The halo is taken from the
+        neighbouring chunks, so every source chunk is still computed only once, while
+        halos at the domain edge are filled with `index.missing_value`.
+
+    Args:
+        arr (dask.array.Array): Array in (y, x, ...) order, chunked like the tiles.
+        tile_size (tuple of int): Size of tiles in x, y direction.
+        tile_bdr (int): Width of the halo.
+
+    Raises:
+        KeyError: If `index.missing_value` is not set in config.
+    """
+    try:
+        pad_value = config.get("index.missing_value")
+    except KeyError:
+        raise KeyError(
+            "Couldn't write halos since index.missing_value is not set in config."
+        )
+    padding = [(0, -arr.shape[0] % tile_size[1]), (0, -arr.shape[1] % tile_size[0])]
+    arr = da.pad(
+        arr, padding + [(0, 0)] * (arr.ndim - 2), constant_values=pad_value
+    ).rechunk({0: tile_size[1], 1: tile_size[0]})
+    depth = {axis: tile_bdr if axis < 2 else 0 for axis in range(arr.ndim)}
+    return da.overlap.overlap(
+        arr, depth=depth, boundary={axis: pad_value for axis in range(arr.ndim)}
+    )
+
+
+def _tile_store_target(
+    dirname, data, tile_size, tile_bdr=0, skip_empty=False, compression=None
+):
+    """Prepares the source and target of `dask.array.store` to write data into tiles.
 
     Args:
         dirname (str, pathlib.Path): name of directory to write output to
-        data (xr.DataArray): array to output
-        tile_nums (tuple of int): number of tiles in x, y direction
-        tile_size (tuple of itn): size of tiles in x, y direction
+        data (xr.DataArray): array to output, tiles at the edge are padded
+        tile_size (tuple of int): size of tiles in x, y direction
+        tile_bdr (int): width of the halo written around every tile (default: 0)
+        skip_empty (bool): whether to skip tiles without any valid cell
+            (default: False)
+        compression (str): codec to compress the tiles with (default: None)
+
+    Returns:
+        arr (dask.array.Array): The data in (y, x, ...) order, chunked like the tiles.
+        writer (_TileWriter): The target writing every chunk to its tile.
     """
+    data = data.transpose("y", "x", ...)
+    data = data.chunk(
+        {
+            # compressed tiles are written with all z-levels at once
+            **{dim: 1 if compression is None else -1 for dim in data.dims},
+            "x": tile_size[0],
+            "y": tile_size[1],
+        }
+    )
+    arr = data.data
+    if tile_bdr:
+        arr = _add_halos(arr, tile_size, tile_bdr)
+    writer = _TileWriter(
+        Path(dirname),
+        int(data.x[0]),
+        int(data.y[0]),
+        tile_size,
+        tile_bdr,
+        nz=data.sizes.get("z", 1),
+        skip_empty=skip_empty,
+        compression=compression,
+    )
+    return arr, writer
+
 
-    def _fmt(x):
-        return f"{x:0{config.get('index.filename_digits')}d}"
+def _write_data_to_files(
+    dirname, data, tile_size, tile_bdr=0, skip_empty=False, compression=None
+):
+    """Outputs data into files depending on tile definitions
 
-    dtype = _generate_dtype_from_config()
+    Note:
+        All tiles are written from a single dask graph, so the source is computed and
+        written in parallel, with only the tiles in flight held in memory. The number of
+        threads is set with `writer.num_workers` in config. 3-D data is written one
+        z-level of a tile at a time, unless it is compressed.
 
-    for x in range(1, tile_nums[0] * tile_size[0], tile_size[0]):
-        for y in range(1, tile_nums[1] * tile_size[1], tile_size[1]):
-            xstart, xend = x, x + tile_size[0] - 1
-            ystart, yend = y, y + tile_size[1] - 1
-            filename = f"{_fmt(xstart)}-{_fmt(xend)}.{_fmt(ystart)}-{_fmt(yend)}"
-            data.sel(
-                {"x": slice(xstart, xend), "y": slice(ystart, yend)}
-            ).values.T.tofile(dirname / filename, format=dtype)
+    Args:
+        dirname (str, pathlib.Path): name of directory to write output to
+        data (xr.DataArray): array to output, tiles at the edge are padded
+        tile_size (tuple of int): size of tiles in x, y direction
+        tile_bdr (int): width of the halo written around every tile (default: 0)
+        skip_empty (bool): whether to skip tiles without any valid cell
+            (default: False)
+        compression (str): codec to compress the tiles with (default: None)
+
+    Returns:
+        stats (dict): Statistics of every written tile, see `wps_xr.stats`.
+        absent (list of str): Names of the skipped tiles.
+    """
+    arr, writer = _tile_store_target(
+        dirname, data, tile_size, tile_bdr, skip_empty, compression
+    )
+    da.store(
+        arr,
+        writer,
+        lock=False,
+        scheduler="threads",
+        num_workers=config.get("writer.num_workers"),
+    )
+    writer.finish()
+    return writer.stats, writer.absent
 
 
 @xr.register_dataset_accessor("wps")
@@ -132,9 +444,25 @@ class WPSAccessor:
             config.set({"index.tile_x": tile_size[0], "index.tile_y": tile_size[1]})
         return tile_size
 
-    def to_disk(self, dirname_or_obj, var=None, tile_size=None, force=False):
+    def to_disk(
+        self,
+        dirname_or_obj,
+        var=None,
+        tile_size=None,
+        force=False,
+        streaming=True,
+        tile_bdr=None,
+        stats=True,
+        skip_empty_tiles=False,
+        compression=None,
+    ):
         """Writes Dataset to disk.
 
+        Note:
+            In streaming mode, the source is computed exactly once and edge tiles are
+            padded and NaNs filled with `index.missing_value` while each tile is
+            written. Otherwise, the whole array is padded and scanned for NaNs first.
+
         Args:
             dirname_or_obj (str, pathlib.Path): Name of output directory.
             var (str): Name of variable to write to disk. (default: the only `data_var`)
@@ -142,12 +470,37 @@ class WPSAccessor:
                 `to_disk` tries to use "index.tile_[x,y]" from config or the dask chunks.
             force (bool): Whether to override existing data if some is present.
                 (default: False)
+            streaming (bool): Whether to pad and fill missing values per tile.
+                (default: True)
+            tile_bdr (int): Width of the halo written around every tile, filled from
+                the neighbouring tiles and with `index.missing_value` at the domain
+                edge. (default: "index.tile_bdr" from config)
+            stats (bool): Whether to write the statistics of every tile, computed
+                while writing it, next to `index`. (default: True)
+            skip_empty_tiles (bool): Whether to skip tiles that are
+                `index.missing_value` everywhere, halo included. Absent tiles are
+                recorded in the manifest and read as `missing_value` by
+                `open_dataset`, but other readers like geogrid may expect them.
+                (default: False)
+            compression (str): Codec to compress every tile with, "gzip", "lzma" or
+                "bz2", at `compression.level`. The tiles are suffixed with ".gz",
+                ".xz" or ".bz2" and read transparently by `open_dataset`, geogrid
+                needs a copy written by `decompress_dataset`. (default: None)
+
+        Raises:
+            KeyError: If padding, filling or halos are needed, but
+                `index.missing_value` is not set in config.
+            ValueError: If the compression codec is unknown.
         """
         dirname_or_obj = Path(dirname_or_obj)
         var = _infer_var_name(self._obj, var)
 
         if isinstance(var, Iterable) and not isinstance(var, (str, bytes)):
             raise Exception("Can only output a single variable.")
+        if compression is not None and compression not in CODECS:
+            raise ValueError(
+                f"Unknown compression {compression}, use one of {list(CODECS)}."
+            )
 
         tile_size = self._get_tile_size_and_set_config(var, tile_size)
 
@@ -158,34 +511,253 @@ class WPSAccessor:
 
         _prepare_wps_directory(dirname_or_obj, force)
 
-        padded = _pad_data_if_needed(self._obj[var], tile_size)
+        if streaming:
+            data = self._obj[var]
+        else:
+            data = _pad_data_if_needed(self._obj[var], tile_size)
+            if data.isnull().any():
+                data = data.fillna(config.get("index.missing_value"))
+
+        if tile_bdr is None:
+            tile_bdr = config.get("index.tile_bdr")
+
+        tile_stats, absent = _write_data_to_files(
+            dirname_or_obj, data, tile_size, tile_bdr, skip_empty_tiles, compression
+        )
 
-        if padded.isnull().any():
-            padded = padded.fillna(config.get("index.missing_value"))
+        # the index of the output only, datasets already open keep their layout
+        index = {**config.get("index"), "tile_bdr": tile_bdr}
+        if "z" in data.dims and "tile_z_start" not in index:
+            index["tile_z"] = data.sizes["z"]
+        with config.set({"index": index}):
+            _write_index(dirname_or_obj)
 
-        shape = np.array([padded.shape[padded.dims.index(d)] for d in ["x", "y"]])
-        tile_nums = shape // tile_size
+        if stats:
+            write_stats(dirname_or_obj, tile_stats)
+        write_manifest(dirname_or_obj, absent=absent)
 
-        _write_data_to_files(dirname_or_obj, padded, tile_nums, tile_size)
+    def map_overlap(self, func, depth, var=None, dtype=None):
+        """Applies a stencil function to the variable, extended by a halo of `depth`.
 
-        _write_index(dirname_or_obj)
+        If the variable comes straight from the tiles and `depth` is at most
+        `index.tile_bdr`, every tile is passed to `func` with its own on-disk halo,
+        so no neighbouring tiles need to be read. Otherwise this falls back to
+        `dask.array.map_overlap`, which fetches the halo from the neighbouring chunks.
 
-    def plot(self, var=None):
+        Note:
+            At the edges of the domain, the on-disk halo is passed as stored in the
+            tiles, while the fallback passes no halo at all.
+
+        Args:
+            func (callable): Function mapping an array with halo to an array of
+                equal shape, e.g. a smoothing or slope filter.
+            depth (int): Width of the halo needed by `func` along x and y.
+            var (str): Name of variable to apply `func` to. (default: the only
+                `data_var`)
+            dtype (str,numpy.dtype): Datatype returned by `func`. (default: dtype of
+                the variable)
+
+        Returns:
+            da (xarray.DataArray): Result of `func` with the halo trimmed again.
+        """
+        var = _infer_var_name(self._obj, var)
+        data = self._obj[var].data
+        dtype = self._obj[var].dtype if dtype is None else dtype
+
+        mosaic, decoded = _find_mosaic(self._obj[var])
+        if mosaic is not None and depth <= mosaic.tile_bdr:
+            result = _map_tile_halos(func, mosaic, depth, decoded, dtype)
+        else:
+            depths = {
+                axis: depth if dim in ["x", "y"] else 0
+                for axis, dim in enumerate(self._obj[var].dims)
+            }
+            result = da.map_overlap(
+                func, da.asarray(data), depth=depths, boundary="none", dtype=dtype
+            )
+        return self._obj[var].copy(data=result)
+
+    def sample(self, lats, lons, var=None):
+        """Samples the variable at the cells nearest to the given points.
+
+        Note:
+            The points are mapped to cells with the `regular_ll` attributes of the
+            Dataset. If the variable comes straight from the tiles, the points are
+            grouped by tile and every tile is read once, only at the sampled cells.
+            Otherwise, the points are selected with vectorized indexing.
+
+        Args:
+            lats (array-like): Latitudes of the points.
+            lons (array-like): Longitudes of the points.
+            var (str): Name of variable to sample. (default: the only `data_var`)
+
+        Returns:
+            da (xarray.DataArray): Values with dim point, and the lat/lon of the points
+                and x/y of the sampled cells as coords.
+
+        Raises:
+            ValueError: If a point lies outside of the Dataset.
+        """
+        var = _infer_var_name(self._obj, var)
+        data = self._obj[var]
+        lats, lons = np.atleast_1d(lats), np.atleast_1d(lons)
+        x, y = _latlon_to_index(lats, lons, self._obj.attrs)
+        x = np.floor(x + 0.5).astype(int) - int(data.x[0])
+        y = np.floor(y + 0.5).astype(int) - int(data.y[0])
+        outside = (x < 0) | (x >= data.sizes["x"]) | (y < 0) | (y >= data.sizes["y"])
+        if outside.any():
+            raise ValueError(f"{outside.sum()} points lie outside of the Dataset.")
+
+        mosaic, decoded = _find_mosaic(data)
+        if mosaic is not None and data.dims[:2] == ("y", "x"):
+            values = _sample_mosaic(mosaic, decoded, y, x)
+        else:
+            values = (
+                data.transpose("y", "x", ...)
+                .isel(x=xr.DataArray(x, dims="point"), y=xr.DataArray(y, dims="point"))
+                .values
+            )
+        dims = ("point",) + tuple(dim for dim in data.dims if dim not in ["x", "y"])
+        coords = {
+            "lat": ("point", lats),
+            "lon": ("point", lons),
+            "x": ("point", data.x.values[x]),
+            "y": ("point", data.y.values[y]),
+        }
+        coords.update({dim: data[dim] for dim in dims[1:] if dim in data.coords})
+        return xr.DataArray(
+            values, dims=dims, coords=coords, attrs=data.attrs, name=var
+        )
+
+    def build_stats(self):
+        """Computes and writes the per-tile statistics of the dataset on disk.
+
+        Note:
+            The statistics are computed from the tiles in the `directory` the Dataset
+            was opened from, see `wps_xr.build_stats`.
+        """
+        build_stats(self._obj.attrs["directory"])
+
+    def to_cache(self, path, var=None):
+        """Writes the variable into a chunked Zarr store or NetCDF file for analysis.
+
+        Note:
+            The chunks are kept, and made uniform if needed. If the variable comes
+            straight from all tiles of the dataset on disk, the cache is registered in
+            its directory and `wps_xr.open_dataset` opens the cache instead of the
+            tiles, as long as no tile has changed. Use `wps_xr.from_cache` to open the
+            cache explicitly.
+
+        Args:
+            path (str,pathlib.Path): Zarr store, or NetCDF file if it ends with ".nc".
+            var (str): Name of variable to cache. (default: the only `data_var`)
+
+        Returns:
+            registered (bool): Whether the cache was registered with the dataset.
+        """
+        var = _infer_var_name(self._obj, var)
+        return to_cache(self._obj, path, var)
+
+    def summary(self, var=None):
+        """Summarizes the variable, from the per-tile statistics if they are valid.
+
+        Args:
+            var (str): Name of variable to summarize. (default: the only `data_var`)
+
+        Returns:
+            summary (xarray.Dataset): `count`, `valid`, `min`, `max`, `sum` and `mean`,
+                and the `histogram` of categories for categorical data.
+        """
+        var = _infer_var_name(self._obj, var)
+        return summarize(self._obj, var)
+
+    def category_fractions(self, factor, var=None):
+        """Computes the fraction of every category within coarse cells.
+
+        Args:
+            factor (int or tuple of int): Number of cells in x, y direction per coarse
+                cell.
+            var (str): Name of categorical variable. (default: the only `data_var`)
+
+        Returns:
+            fractions (xarray.DataArray): Fractions with dims (y, x, category).
+        """
+        var = _infer_var_name(self._obj, var)
+        return category_fractions(self._obj[var], factor)
+
+    def category_histogram(self, region=None, var=None):
+        """Counts the cells of every category, optionally within a region.
+
+        Args:
+            region (dict or xarray.DataArray): Either a selection passed to `sel`, e.g.
+                `{"lat": slice(40, 50)}`, or a boolean mask. (default: all cells)
+            var (str): Name of categorical variable. (default: the only `data_var`)
+
+        Returns:
+            counts (xarray.DataArray): Number of cells with dim category.
+        """
+        var = _infer_var_name(self._obj, var)
+        return category_histogram(self._obj[var], region)
+
+    def coarsen(self, factor, method=None, var=None):
+        """Coarsens the variable tile by tile, ready to be written with `to_disk`.
+
+        Note:
+            This populates the `index` of the wps_xr.config object with the coarse
+            grid, i.e. `dx`, `dy`, `known_*` and `tile_[x,y]`.
+
+        Args:
+            factor (int or tuple of int): Number of cells in x, y direction per coarse
+                cell.
+            method (str): "mode" (majority) or "mean", ignoring missing values.
+                (default: "mode" for categorical, "mean" for continuous data)
+            var (str): Name of variable to coarsen. (default: the only `data_var`)
+
+        Returns:
+            ds (xarray.Dataset): The coarse variable with lat/lon coords.
+        """
+        var = _infer_var_name(self._obj, var)
+        return coarsen(self._obj, factor, method, var)
+
+    def plot(self, var=None, overview=True, ax=None):
         """Plot variable sensibly.
 
         Plots the given variable in the right orientation,
         using a categorical colorbar for categorical data.
 
+        Note:
+            Only the cells within the lat/lon limits set on `ax` are read, and the
+            variable is decimated lazily to the pixel size of `ax` before computing,
+            using the majority for categorical and the mean for continuous data.
+
         Args:
             var (str): Variable to plot
+            overview (bool): Whether to start from the coarsest overview level still
+                finer than the pixels of `ax`, if there are any. (default: True)
+            ax (matplotlib.axes.Axes): Axes to plot on. (default: current axes)
         """
+        import matplotlib.pyplot as plt
+
         var = _infer_var_name(self._obj, var)
+        ax = plt.gca() if ax is None else ax
+        obj = _limit_to_view(self._obj, ax)
+        extent = ax.get_window_extent()
+        pixels = (max(int(extent.width), 1), max(int(extent.height), 1))
+        if overview:
+            obj = _select_overview(obj, var, pixels)
+
+        data = obj[var]
+        factor = tuple(
+            max(data.sizes[dim] // size, 1) for dim, size in zip(["x", "y"], pixels)
+        )
+        if factor != (1, 1):
+            data = _coarsen_array(data, factor)
 
-        if self._obj[var].attrs["type"] == "categorical":
+        if data.attrs["type"] == "categorical":
             levels = list(
                 range(
-                    self._obj[var].attrs["category_min"] - 1,
-                    self._obj[var].attrs["category_max"] + 1,
+                    data.attrs["category_min"] - 1,
+                    data.attrs["category_max"] + 1,
                 )
             )
             add_args = {"levels": levels}
@@ -193,4 +765,4 @@ class WPSAccessor:
                 add_args["cbar_kwargs"] = {"ticks": levels}
         else:
             add_args = {}
-        return self._obj[var].plot(x="lon", y="lat", **add_args)
+        return data.plot(x="lon", y="lat", ax=ax, **add_args)